@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AgreementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'agreement'
+
+    def ready(self):
+        # Connects the query timing to each database connection as it opens
+        from . import instrumentation  # noqa: F401
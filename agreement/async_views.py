@@ -0,0 +1,120 @@
+"""
+Native async versions of the agreement read endpoints, used when the
+project is served over ASGI (see ASYNC_READ_VIEWS). They mirror
+LegalAgreementViewSet.retrieve, get_by_access_token and by_party, but
+await the ORM and cache instead of holding a worker thread. Serialization
+runs on fully loaded instances and rows, with their templates compiled
+beforehand, so it never touches the database.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import cache as agreement_cache
+from .models import LegalAgreement
+from .pagination import KeysetPagination
+from .rendering import aload_templates
+from .queries import atoken_agreement_id, party_agreements, party_filters, projected_fields
+from .routers import replica_reads
+from .serializers import CompactAgreementSerializer, LegalAgreementSerializer
+from .throttling import check_throttles
+
+
+def json_response(data, status=200, headers=None):
+    # Same encoding as DRF's JSONRenderer so both code paths return identical bodies
+    return JsonResponse(
+        data, encoder=JSONEncoder, safe=False, status=status, headers=headers,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+def async_reads(handler, sync_view, throttle_classes=()):
+    """
+    Serve GET/HEAD with the async `handler` and hand every other method to
+    the synchronous DRF view registered on the same route.
+    """
+    async_sync_view = sync_to_async(sync_view)
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            try:
+                if throttle_classes:
+                    await sync_to_async(check_throttles)(request, throttle_classes)
+                return await handler(request, *args, **kwargs)
+            except APIException as exc:
+                headers = {'Retry-After': '%d' % exc.wait} if getattr(exc, 'wait', None) else None
+                return json_response({'detail': exc.detail}, status=exc.status_code, headers=headers)
+        return await async_sync_view(request, *args, **kwargs)
+    return view
+
+
+async def cached_agreement_response(request, agreement_id, include_access_token=True):
+    base_url = request.build_absolute_uri('/')
+    version, entry = await agreement_cache.aget_payload(agreement_id, base_url)
+    if entry is None:
+        try:
+            instance = await LegalAgreement.objects.with_content().aget(id=agreement_id)
+        except LegalAgreement.DoesNotExist:
+            return None
+        await aload_templates([instance.template_id])
+        # Cached with the file links; present() strips them for public reads
+        data = LegalAgreementSerializer(instance, context={'request': Request(request), 'file_links': True}).data
+        entry = await agreement_cache.aset_payload(agreement_id, version, base_url, data)
+
+    etag, data = agreement_cache.present(entry, include_access_token)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    return json_response(data, headers={'ETag': etag})
+
+
+async def retrieve(request, pk):
+    with replica_reads():
+        response = await cached_agreement_response(request, pk, include_access_token=False)
+    if response is None:
+        return json_response({"detail": "Agreement not found."}, status=403)
+    return response
+
+
+async def get_by_access_token(request):
+    access_token = request.GET.get('access_token')
+    with replica_reads():
+        agreement_id = await agreement_cache.aget_token_agreement_id(access_token)
+        if agreement_id is None:
+            agreement_id = await atoken_agreement_id(access_token)
+            if agreement_id is None:
+                return json_response({"detail": "Invalid access token."}, status=400)
+            await agreement_cache.aremember_token(access_token, agreement_id)
+
+        response = await cached_agreement_response(request, agreement_id)
+    if response is None:
+        return json_response({"detail": "Invalid access token."}, status=400)
+    return response
+
+
+async def by_party(request):
+    request = Request(request)
+    address = request.query_params.get('address')
+    if not address:
+        return json_response({"detail": "Query parameter 'address' is required."}, status=400)
+
+    fields = projected_fields(request.query_params)
+    serializer = CompactAgreementSerializer(fields, request)
+    agreements = serializer.rows(party_agreements(address, fields, **party_filters(request.query_params)))
+
+    paginator = KeysetPagination()
+    with replica_reads():
+        if paginator.is_requested(request):
+            page = await paginator.apaginate_queryset(agreements, request)
+            await aload_templates(serializer.template_ids(page))
+            return json_response(paginator.get_paginated_data(serializer.serialize(page)))
+
+        page = [agreement async for agreement in agreements]
+        await aload_templates(serializer.template_ids(page))
+    return json_response(serializer.serialize(page))
@@ -0,0 +1,174 @@
+"""
+Shared helpers for the `benchmark_api` and `load_test` commands: seeding,
+latency statistics and pytest-benchmark style JSON results that can be
+diffed between commits.
+"""
+import json
+import platform
+import random
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .models import LegalAgreement, normalize_address
+
+
+def unthrottled():
+    """
+    Settings overrides that lift the API rate limits, which would otherwise
+    turn most benchmark rounds into 429s.
+    """
+    return {'REST_FRAMEWORK': {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}}
+
+
+def random_address():
+    return f"0x{random.getrandbits(160):040X}"
+
+
+def seed_agreements(count, parties, batch_size=5000, using='default'):
+    """
+    Insert `count` agreements spread over `parties` addresses. Returns the
+    party addresses so scenarios can pick realistic lookups.
+    """
+    addresses = [random_address() for _ in range(parties)]
+    batch = []
+    for _ in range(count):
+        first, second = random.sample(addresses, 2)
+        batch.append(LegalAgreement(
+            content='benchmark ' * 200,
+            agreementType='benchmark',
+            email=None,
+            first_party_address=first,
+            second_party_address=second,
+            first_party_address_normalized=normalize_address(first),
+            second_party_address_normalized=normalize_address(second),
+        ))
+        if len(batch) >= batch_size:
+            LegalAgreement.objects.using(using).bulk_create(batch)
+            batch = []
+    if batch:
+        LegalAgreement.objects.using(using).bulk_create(batch)
+    return addresses
+
+
+CLAUSES = (
+    "This Agreement is entered into on the date last signed below by and between the parties identified herein.",
+    "Each party represents and warrants that it has full power and authority to enter into and perform this Agreement.",
+    "The parties agree to keep confidential all information disclosed under this Agreement and to use it solely for its purposes.",
+    "Either party may terminate this Agreement upon thirty (30) days written notice to the other party.",
+    "This Agreement shall be governed by and construed in accordance with the laws of the jurisdiction of the first party.",
+    "Any dispute arising out of or in connection with this Agreement shall be resolved by binding arbitration.",
+    "This Agreement constitutes the entire agreement between the parties and supersedes all prior understandings.",
+    "No amendment to this Agreement shall be effective unless made in writing and signed by both parties.",
+    "Neither party shall be liable for any failure to perform caused by circumstances beyond its reasonable control.",
+    "Payment of the agreed amount shall be made within fourteen (14) days of receipt of a valid invoice.",
+)
+
+
+def agreement_text(rng=random):
+    """
+    Plausible agreement text: shared boilerplate clauses around a few
+    party-specific details, like documents produced from templates.
+    """
+    clauses = rng.sample(CLAUSES, rng.randint(5, len(CLAUSES)))
+    details = (
+        f"The first party agrees to pay {rng.randint(100, 100_000)} USD to {random_address()} "
+        f"for services described in schedule {rng.randint(1, 40)}."
+    )
+    clauses.insert(rng.randint(0, len(clauses)), details)
+    return '\n\n'.join(clauses)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(name, timings, elapsed=None, queries=None, errors=0):
+    """
+    Stats for one scenario; timings are seconds per call.
+    """
+    values = sorted(timings)
+    stats = {
+        'rounds': len(values),
+        'errors': errors,
+        'min': values[0] if values else 0.0,
+        'max': values[-1] if values else 0.0,
+        'mean': statistics.fmean(values) if values else 0.0,
+        'median': percentile(values, 0.5),
+        'p90': percentile(values, 0.9),
+        'p99': percentile(values, 0.99),
+        'ops': len(values) / (elapsed if elapsed else sum(values) or 1),
+    }
+    if queries is not None:
+        stats['queries_mean'] = statistics.fmean(queries) if queries else 0.0
+        stats['queries_max'] = max(queries) if queries else 0
+    return {'name': name, 'stats': stats}
+
+
+def commit_info():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'id': commit}
+
+
+def build_report(benchmarks, params):
+    return {
+        'datetime': datetime.now(timezone.utc).isoformat(),
+        'machine_info': {
+            'python_version': platform.python_version(),
+            'machine': platform.machine(),
+            'system': platform.system(),
+        },
+        'commit_info': commit_info(),
+        'params': params,
+        'benchmarks': benchmarks,
+    }
+
+
+def write_report(path, report):
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+def format_benchmark(benchmark):
+    stats = benchmark['stats']
+    line = (
+        f"{benchmark['name']:>24}: {stats['ops']:8.1f} ops/s  "
+        f"p50 {stats['median'] * 1000:7.2f} ms  p90 {stats['p90'] * 1000:7.2f} ms  "
+        f"p99 {stats['p99'] * 1000:7.2f} ms"
+    )
+    if 'queries_mean' in stats:
+        line += f"  queries {stats['queries_mean']:.1f}"
+    if stats['errors']:
+        line += f"  errors {stats['errors']}"
+    return line
+
+
+def compare_reports(baseline, current):
+    """
+    Lines describing the change of each scenario's median and throughput
+    relative to a baseline report.
+    """
+    previous = {benchmark['name']: benchmark['stats'] for benchmark in baseline['benchmarks']}
+    lines = []
+    for benchmark in current['benchmarks']:
+        before = previous.get(benchmark['name'])
+        if not before:
+            continue
+        after = benchmark['stats']
+        median = (after['median'] - before['median']) / before['median'] * 100 if before['median'] else 0.0
+        ops = (after['ops'] - before['ops']) / before['ops'] * 100 if before['ops'] else 0.0
+        line = f"{benchmark['name']:>24}: median {median:+6.1f}%  ops {ops:+6.1f}%"
+        if 'queries_mean' in after and 'queries_mean' in before:
+            line += f"  queries {before['queries_mean']:.1f} -> {after['queries_mean']:.1f}"
+        lines.append(line)
+    return lines
@@ -0,0 +1,92 @@
+from collections import Counter
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+
+from .images import schedule_thumbnails
+from .models import Blob, EmailOutbox, LegalAgreement, normalize_address
+from .outbox import access_token_email
+from .rendering import load_templates
+from .search import index_content
+from .tokenfilter import remember_tokens
+from .uploads import read_blob_token
+
+
+def resolve_blob_references(items):
+    """
+    Replace blob tokens in the file fields of validated bulk items with
+    Blob rows, fetched in one query. Valid-ID fields only take blobs that
+    were uploaded with purpose=valid_id and processed as images. Returns
+    errors keyed by item index, in the same shape as ListSerializer.errors.
+    """
+    payloads = {
+        item[field]: read_blob_token(item[field]) for item in items for field in LegalAgreement.FILE_FIELDS
+        if item.get(field) is not None
+    }
+    blobs = Blob.objects.in_bulk({payload['blob'] for payload in payloads.values() if payload})
+
+    errors = {}
+    for index, item in enumerate(items):
+        item_errors = {}
+        for field in LegalAgreement.FILE_FIELDS:
+            token = item.get(field)
+            if token is None:
+                continue
+            payload = payloads[token]
+            blob = blobs.get(payload['blob']) if payload else None
+            if payload is None:
+                item_errors[field] = ["Invalid or expired blob token."]
+            elif blob is None or blob.sha256 != payload['sha256']:
+                item_errors[field] = ["Blob no longer exists."]
+            elif field in LegalAgreement.IMAGE_FIELDS and not payload['normalized']:
+                item_errors[field] = ["Upload ID images with purpose=valid_id."]
+            else:
+                item[field] = blob
+        if item_errors:
+            errors[index] = item_errors
+    return errors
+
+
+def bulk_create_agreements(items):
+    """
+    Insert validated agreements with one INSERT per batch, take blob
+    references in one UPDATE per blob and queue access-token emails in one
+    INSERT, all in a single transaction.
+    """
+    agreements = []
+    references = Counter()
+    for item in items:
+        fields = dict(item)
+        for field in LegalAgreement.FILE_FIELDS:
+            blob = fields.pop(field, None)
+            if blob is not None:
+                fields[field] = blob.name
+                references[blob.pk] += 1
+        agreement = LegalAgreement(**fields)
+        # bulk_create bypasses save(), so derive the lookup columns here
+        agreement.first_party_address_normalized = normalize_address(agreement.first_party_address)
+        agreement.second_party_address_normalized = normalize_address(agreement.second_party_address)
+        agreement.signing_status = LegalAgreement.signing_status_for(agreement.second_party_signature)
+        agreement._stored_files = agreement.loaded_file_names()
+        agreements.append(agreement)
+
+    with transaction.atomic():
+        LegalAgreement.objects.bulk_create(agreements, batch_size=500)
+        for blob_id, count in references.items():
+            Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') + count)
+        load_templates({agreement.template_id for agreement in agreements})
+        index_content([(agreement.pk, agreement.render_content()) for agreement in agreements])
+        remember_tokens([agreement.access_token for agreement in agreements])
+        EmailOutbox.objects.bulk_create(
+            [access_token_email(agreement) for agreement in agreements if agreement.email]
+        )
+        images = {
+            getattr(agreement, field).name
+            for agreement in agreements for field in LegalAgreement.IMAGE_FIELDS
+            if getattr(agreement, field)
+        }
+        for name in images:
+            transaction.on_commit(partial(schedule_thumbnails, name))
+
+    return agreements
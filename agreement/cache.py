@@ -0,0 +1,144 @@
+import hashlib
+import json
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from .routers import replica_alias
+
+
+def get_cache():
+    return caches[settings.AGREEMENT_CACHE_ALIAS]
+
+
+def version_key(agreement_id):
+    return f"agreement:{agreement_id}:version"
+
+
+def token_key(access_token):
+    return f"agreement:token:{access_token}"
+
+
+def current_version(agreement_id):
+    """
+    Version stamp of an agreement's cached payloads. Invalidation drops the
+    stamp, orphaning every payload cached under it whatever the host.
+    """
+    cache = get_cache()
+    key = version_key(agreement_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+async def acurrent_version(agreement_id):
+    cache = get_cache()
+    key = version_key(agreement_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, None)
+        version = await cache.aget(key)
+    return version
+
+
+def payload_key(agreement_id, version, base_url):
+    return f"agreement:{agreement_id}:{version}:{base_url}"
+
+
+def compute_etag(data):
+    encoded = json.dumps(data, sort_keys=True, default=str).encode()
+    return f'"{hashlib.sha1(encoded).hexdigest()}"'
+
+
+def get_payload(agreement_id, base_url):
+    """
+    Returns the current version and the cached (etag, data) entry for an
+    agreement rendered for `base_url` (None on a miss). The version must be
+    read before the database so a concurrent write can never leave a stale
+    payload under the current version.
+    """
+    version = current_version(agreement_id)
+    return version, get_cache().get(payload_key(agreement_id, version, base_url))
+
+
+async def aget_payload(agreement_id, base_url):
+    version = await acurrent_version(agreement_id)
+    return version, await get_cache().aget(payload_key(agreement_id, version, base_url))
+
+
+def payload_timeout():
+    # A replica read may predate the write that bumped the version, so keep
+    # it only as long as replication lag can plausibly last
+    if replica_alias():
+        return min(settings.AGREEMENT_CACHE_TIMEOUT, settings.AGREEMENT_CACHE_REPLICA_TIMEOUT)
+    return settings.AGREEMENT_CACHE_TIMEOUT
+
+
+def set_payload(agreement_id, version, base_url, data):
+    entry = (compute_etag(data), dict(data))
+    get_cache().set(payload_key(agreement_id, version, base_url), entry, payload_timeout())
+    return entry
+
+
+async def aset_payload(agreement_id, version, base_url, data):
+    entry = (compute_etag(data), dict(data))
+    await get_cache().aset(payload_key(agreement_id, version, base_url), entry, payload_timeout())
+    return entry
+
+
+def present(entry, include_access_token=True):
+    """
+    (etag, data) to send for a cached entry; the public variant drops the
+    access token and the file links and carries its own ETag.
+    """
+    from .models import LegalAgreement
+
+    etag, data = entry
+    if include_access_token:
+        return etag, data
+    private = {'access_token', *LegalAgreement.FILE_FIELDS, *(f'{name}_thumbnails' for name in LegalAgreement.IMAGE_FIELDS)}
+    return f'{etag[:-1]}-public"', {key: value for key, value in data.items() if key not in private}
+
+
+def invalidate_agreement(agreement_id):
+    """
+    Drop the version stamp now and again once the write commits: a read
+    racing the transaction can still see the old row and cache it under a
+    fresh stamp in between.
+    """
+    key = version_key(agreement_id)
+    get_cache().delete(key)
+    after_commit(key)
+
+
+def get_token_agreement_id(access_token):
+    return get_cache().get(token_key(access_token))
+
+
+async def aget_token_agreement_id(access_token):
+    return await get_cache().aget(token_key(access_token))
+
+
+def remember_token(access_token, agreement_id):
+    # Access tokens never change, so the mapping is kept until delete
+    get_cache().set(token_key(access_token), agreement_id, None)
+
+
+async def aremember_token(access_token, agreement_id):
+    await get_cache().aset(token_key(access_token), agreement_id, None)
+
+
+def forget_token(access_token):
+    key = token_key(access_token)
+    get_cache().delete(key)
+    after_commit(key)
+
+
+def after_commit(key):
+    if connection.in_atomic_block:
+        transaction.on_commit(partial(get_cache().delete, key))
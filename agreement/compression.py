@@ -0,0 +1,150 @@
+"""
+Compressed storage for agreement text.
+
+Values are stored as one format byte followed by the payload:
+
+- 0x00: UTF-8 text, kept as is when compression doesn't pay off.
+- 0x01: raw DEFLATE stream.
+- 0x02: 4-byte Adler-32 of a preset dictionary, then a raw DEFLATE stream
+  compressed against that dictionary.
+
+Dictionaries live in the ContentDictionary table and are never changed
+once written; the newest one is used for new writes. Agreements share
+most of their boilerplate, so a dictionary trained on existing texts (see
+`manage.py train_content_dictionary`) shrinks short documents far more
+than compressing each one on its own.
+"""
+import re
+import struct
+import zlib
+from collections import Counter
+
+from django.db import models
+
+RAW, DEFLATE, DEFLATE_DICT = b'\x00', b'\x01', b'\x02'
+LEVEL = 9
+WBITS = -15
+MAX_DICTIONARY_SIZE = 32 * 1024  # the DEFLATE window; anything beyond is never referenced
+
+ACTIVE = object()
+
+_dictionaries = {}
+_active = []
+
+
+def dictionary_checksum(data):
+    return zlib.adler32(data)
+
+
+def active_dictionary():
+    """
+    (checksum, data) of the newest dictionary, or None. Looked up once per
+    process, so a newly trained dictionary is picked up on restart.
+    """
+    if not _active:
+        from .models import ContentDictionary
+
+        row = ContentDictionary.objects.order_by('-id').values_list('checksum', 'data').first()
+        _active.append((row[0], bytes(row[1])) if row else None)
+    return _active[0]
+
+
+def get_dictionary(checksum):
+    if checksum not in _dictionaries:
+        from .models import ContentDictionary
+
+        data = ContentDictionary.objects.filter(checksum=checksum).values_list('data', flat=True).first()
+        if data is None:
+            raise ValueError(f"Unknown content dictionary {checksum:#010x}.")
+        _dictionaries[checksum] = bytes(data)
+    return _dictionaries[checksum]
+
+
+def clear_dictionary_cache():
+    _dictionaries.clear()
+    _active.clear()
+
+
+def deflate(data, dictionary=None):
+    if dictionary is None:
+        compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, WBITS)
+    else:
+        compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, WBITS, zdict=dictionary)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress(text, dictionary=ACTIVE):
+    """
+    Smallest encoding of `text`. `dictionary` is a (checksum, data) pair,
+    None to compress without one, or the active dictionary by default.
+    """
+    data = text.encode('utf-8')
+    if dictionary is ACTIVE:
+        dictionary = active_dictionary()
+    candidates = [RAW + data, DEFLATE + deflate(data)]
+    if dictionary is not None:
+        checksum, zdict = dictionary
+        candidates.append(DEFLATE_DICT + struct.pack('>I', checksum) + deflate(data, zdict))
+    return min(candidates, key=len)
+
+
+def decompress(value):
+    value = bytes(value)
+    kind, payload = value[:1], value[1:]
+    if kind == RAW:
+        return payload.decode('utf-8')
+    if kind == DEFLATE:
+        return zlib.decompress(payload, WBITS).decode('utf-8')
+    if kind == DEFLATE_DICT:
+        (checksum,) = struct.unpack('>I', payload[:4])
+        decompressor = zlib.decompressobj(WBITS, zdict=get_dictionary(checksum))
+        return (decompressor.decompress(payload[4:]) + decompressor.flush()).decode('utf-8')
+    raise ValueError(f"Unknown content encoding {kind!r}.")
+
+
+def train_dictionary(samples, size=MAX_DICTIONARY_SIZE):
+    """
+    Build a preset dictionary from the passages (sentences and lines) that
+    recur across `samples`. DEFLATE reaches the end of the dictionary with
+    the shortest distances, so the most valuable passages go last.
+    """
+    counts = Counter()
+    for text in samples:
+        counts.update({
+            passage for passage in re.split(r'(?<=[.;:\n])', text) if len(passage.strip()) >= 8
+        })
+    recurring = sorted(
+        (passage for passage, count in counts.items() if count > 1),
+        key=lambda passage: counts[passage] * len(passage),
+    )
+
+    chosen, total = [], 0
+    for passage in reversed(recurring):
+        encoded = passage.encode('utf-8')
+        if total + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        total += len(encoded)
+    return b''.join(reversed(chosen))
+
+
+class CompressedTextField(models.TextField):
+    """
+    TextField stored as compressed bytes (see the module docstring). Reads
+    and writes see plain strings; lookups other than exact don't apply.
+    """
+    description = "Compressed text"
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        return connection.Database.Binary(compress(value))
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return decompress(value)
@@ -0,0 +1,164 @@
+"""
+Streaming exports of every agreement for compliance archives.
+
+Rows are read in id order with `iterator()`, so memory stays flat however
+large the table is, and written as gzipped NDJSON or CSV. With media, the
+output is a gzipped tar in which each chunk of rows is a data file followed
+by the files those rows reference. Every row carries its id, so an
+interrupted export resumes from the last id received (`after`).
+"""
+import csv
+import io
+import json
+import logging
+import tarfile
+import time
+import zlib
+
+from django.conf import settings
+
+from .models import LegalAgreement
+from .rendering import render_template
+from .storage import blob_storage
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('ndjson', 'csv')
+FIELDS = [
+    field.attname for field in LegalAgreement._meta.concrete_fields
+    if field.name not in ('first_party_address_normalized', 'second_party_address_normalized')
+]
+BLOCK_SIZE = 64 * 1024
+
+
+def export_value(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return value
+    return str(value)
+
+
+class AgreementExport:
+    """
+    One export run. `stream()` yields the gzipped bytes; `count` and
+    `last_id` report progress, `last_id` being the watermark to resume
+    from.
+    """
+    def __init__(self, output='ndjson', after=0, media=False, chunk_size=None, using=None):
+        if output not in FORMATS:
+            raise ValueError(f"Unknown export format {output!r}.")
+        self.output = output
+        self.after = after
+        self.media = media
+        self.chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+        self.using = using
+        self.count = 0
+        self.last_id = after
+
+    @property
+    def filename(self):
+        return f"agreements-after-{self.after}.{'tar' if self.media else self.output}.gz"
+
+    def rows(self):
+        queryset = (
+            LegalAgreement.objects.using(self.using).with_content()
+            .filter(id__gt=self.after).order_by('id').values(*FIELDS)
+        )
+        for row in queryset.iterator(chunk_size=self.chunk_size):
+            if row['template_id'] is not None:
+                row['content'] = render_template(row['template_id'], row['variables'])
+            yield {name: export_value(value) for name, value in row.items()}
+
+    def chunks(self):
+        chunk = []
+        for row in self.rows():
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def encode(self, chunk, header=True):
+        if self.output == 'ndjson':
+            return ''.join(
+                json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n' for row in chunk
+            ).encode('utf-8')
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(FIELDS)
+        for row in chunk:
+            writer.writerow([
+                json.dumps(row[name]) if isinstance(row[name], (dict, list)) else row[name]
+                for name in FIELDS
+            ])
+        return buffer.getvalue().encode('utf-8')
+
+    def parts(self, chunk, first):
+        """
+        Uncompressed output for one chunk of rows.
+        """
+        if not self.media:
+            yield self.encode(chunk, header=first)
+            return
+
+        member = f"agreements-{chunk[0]['id']:012d}-{chunk[-1]['id']:012d}.{self.output}"
+        yield from tar_member(member, [self.encode(chunk)])
+        files = {row[field] for row in chunk for field in LegalAgreement.FILE_FIELDS if row[field]}
+        for name in sorted(files):
+            yield from self.media_member(name)
+
+    def media_member(self, name):
+        try:
+            size = blob_storage.size(name)
+            file = blob_storage.open(name, 'rb')
+        except OSError:
+            logger.warning("Export skipped missing file %s", name)
+            return
+        with file:
+            yield from tar_member(f'media/{name}', iter(lambda: file.read(BLOCK_SIZE), b''), size)
+
+    def stream(self):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip container
+        for number, chunk in enumerate(self.chunks()):
+            for data in self.parts(chunk, first=number == 0):
+                compressed = compressor.compress(data)
+                if compressed:
+                    yield compressed
+            # Flush at every chunk boundary, so a cut-off export still
+            # decompresses up to the last chunk it reported
+            yield compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.count += len(chunk)
+            self.last_id = chunk[-1]['id']
+        if self.media:
+            yield compressor.compress(tarfile.NUL * tarfile.BLOCKSIZE * 2)  # end of archive
+        yield compressor.flush()
+
+
+def tar_member(name, blocks, size=None):
+    """
+    Tar header, content and padding for one member, streamed from
+    `blocks`. Without `size`, the blocks are joined to measure them.
+    """
+    if size is None:
+        blocks = [b''.join(blocks)]
+        size = len(blocks[0])
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    yield info.tobuf(format=tarfile.PAX_FORMAT)
+    written = 0
+    for block in blocks:
+        written += len(block)
+        yield block
+    if written != size:
+        raise OSError(f"{name} changed size while being exported.")
+    remainder = size % tarfile.BLOCKSIZE
+    if remainder:
+        yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
@@ -0,0 +1,90 @@
+"""
+Idempotency-Key support for unsafe endpoints. The first request with a
+given key claims it; its response is stored and replayed to every retry
+with the same key, method and path, so a client that lost the response
+can safely send the request again. Retries arriving while the first
+request is still running get 409. Server errors are not stored, so the
+request can be retried with the same key.
+"""
+import functools
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def claim(key, request):
+    """
+    (record, created) for `key` on this request. A record older than
+    IDEMPOTENCY_KEY_TTL is discarded and the key claimed afresh.
+    """
+    lookup = {'key': key, 'method': request.method, 'path': request.path}
+    cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    record = IdempotencyKey.objects.filter(**lookup).first()
+    if record is not None:
+        if record.created_at >= cutoff:
+            return record, False
+        record.delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(**lookup), True
+    except IntegrityError:
+        # Claimed by a concurrent request with the same key
+        return IdempotencyKey.objects.get(**lookup), False
+
+
+def replay(record):
+    if record.status_code is None:
+        return Response(
+            {"detail": f"A request with this {HEADER} is still in progress."}, status=status.HTTP_409_CONFLICT
+        )
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view_method):
+    """
+    Make a viewset method honour the Idempotency-Key header. Requests
+    without the header are handled as usual.
+    """
+    @functools.wraps(view_method)
+    def view(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"detail": f"{HEADER} must be at most 255 characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        record, created = claim(key, request)
+        if not created:
+            return replay(record)
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=['status_code', 'response'])
+        return response
+    return view
+
+
+def purge_expired_keys(max_age=None):
+    """
+    Delete keys older than `max_age` seconds (IDEMPOTENCY_KEY_TTL by
+    default). Returns how many went.
+    """
+    max_age = settings.IDEMPOTENCY_KEY_TTL if max_age is None else max_age
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
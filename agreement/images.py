@@ -0,0 +1,129 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from rest_framework.exceptions import ValidationError
+
+from .storage import blob_digest, blob_storage
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_PREFIX = 'thumbnails/'
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS, thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def encode(image):
+    """
+    Re-encode an image in the configured format. Metadata (EXIF, GPS,
+    ICC profiles) is not carried over.
+    """
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format=settings.IMAGE_FORMAT, quality=settings.IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def normalize_image(file):
+    """
+    Downscale an uploaded ID image to IMAGE_MAX_DIMENSION, apply its EXIF
+    orientation, strip metadata and re-encode it. Returns a ContentFile, or
+    None when the upload cannot be decoded and should be stored untouched.
+    Raises ValidationError for images over Pillow's decompression bomb limit.
+    """
+    # Pillow is imported on first use; it's one of the slowest imports at boot
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    max_size = (settings.IMAGE_MAX_DIMENSION, settings.IMAGE_MAX_DIMENSION)
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            # Let the JPEG decoder skip straight to a reduced scale
+            image.draft('RGB', max_size)
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(max_size, Image.LANCZOS)
+            data = encode(image)
+    except Image.DecompressionBombError:
+        raise ValidationError("The image has too many pixels to process.")
+    except (UnidentifiedImageError, OSError):
+        file.seek(0)
+        return None
+
+    base = os.path.splitext(os.path.basename(file.name or 'image'))[0]
+    return ContentFile(data, name=f"{base}.{settings.IMAGE_FORMAT.lower()}")
+
+
+def thumbnail_name(name, variant):
+    digest = blob_digest(name)
+    if not digest:
+        return None
+    return f"{THUMBNAIL_PREFIX}{digest[:2]}/{digest}_{variant}.{settings.IMAGE_FORMAT.lower()}"
+
+
+def thumbnail_names(name):
+    return {variant: thumbnail_name(name, variant) for variant in settings.IMAGE_THUMBNAIL_SIZES}
+
+
+def generate_thumbnails(name):
+    """
+    Write every thumbnail variant of a stored image. Thumbnails are keyed by
+    the blob digest, so agreements sharing an image share its thumbnails.
+    """
+    from PIL import UnidentifiedImageError
+
+    if not blob_digest(name):
+        return
+    try:
+        write_thumbnails(name)
+    except (UnidentifiedImageError, OSError):
+        logger.exception("Could not generate thumbnails for %s", name)
+
+
+def write_thumbnails(name):
+    from PIL import Image
+
+    with blob_storage.open(name, 'rb') as file, Image.open(file) as image:
+        image.load()
+        for variant, size in settings.IMAGE_THUMBNAIL_SIZES.items():
+            target = thumbnail_name(name, variant)
+            if default_storage.exists(target):
+                continue
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            default_storage.save(target, ContentFile(encode(thumbnail)))
+
+
+def ensure_thumbnail(name, variant):
+    """
+    Name of a thumbnail variant of a stored image. The variants are rendered
+    here first when the background job that should have written them was
+    lost, e.g. to a worker restart.
+    """
+    target = thumbnail_name(name, variant)
+    if target and not default_storage.exists(target):
+        generate_thumbnails(name)
+    return target
+
+
+def schedule_thumbnails(name):
+    return get_executor().submit(generate_thumbnails, name)
+
+
+def delete_thumbnails(name):
+    for target in thumbnail_names(name).values():
+        if target:
+            default_storage.delete(target)
@@ -0,0 +1,168 @@
+"""
+Per-request performance instrumentation.
+
+`timed(phase)` records the time spent in a block against the request being
+served (see PerformanceMiddleware) and against process-wide histograms that
+the admin-only metrics endpoint exposes in Prometheus text format.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Time and call count per phase (db, storage, mail, serialize) for one request.
+    """
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, phase, duration):
+        count, total = self.phases.get(phase, (0, 0.0))
+        self.phases[phase] = (count + 1, total + duration)
+
+    def server_timing(self, total):
+        entries = [
+            f'{phase};dur={duration * 1000:.2f};desc="{count} calls"'
+            for phase, (count, duration) in self.phases.items()
+        ]
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def db_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add('db', time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Installed on every connection as it opens, in whichever thread runs the
+    # queries: async views query from sync_to_async threads, which see the
+    # request's metrics because the context is copied over to them
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+
+@contextmanager
+def collect():
+    """
+    Make a fresh RequestMetrics current for the duration of the block.
+    """
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add(phase, duration)
+        else:
+            # Outside a request (workers, commands) only the histograms see it
+            registry.observe('custos_phase_duration_seconds', {'view': '', 'phase': phase}, duration)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Thread-safe, process-local set of histograms keyed by metric name and labels.
+    """
+    HELP = {
+        'custos_request_duration_seconds': 'Total request handling time.',
+        'custos_phase_duration_seconds': 'Time spent per request phase (db, storage, mail, serialize).',
+        'custos_db_queries_per_request': 'Database queries issued per request.',
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                buckets = COUNT_BUCKETS if name == 'custos_db_queries_per_request' else TIME_BUCKETS
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def observe_request(self, view, total, metrics):
+        self.observe('custos_request_duration_seconds', {'view': view}, total)
+        for phase, (count, duration) in metrics.phases.items():
+            self.observe('custos_phase_duration_seconds', {'view': view, 'phase': phase}, duration)
+        self.observe('custos_db_queries_per_request', {'view': view}, metrics.phases.get('db', (0, 0.0))[0])
+
+    def render(self):
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        with self.lock:
+            items = sorted(
+                (key, h.buckets, list(h.counts), h.sum, h.count) for key, h in self.histograms.items()
+            )
+
+        lines, described = [], set()
+        for (name, labels), buckets, counts, total, count in items:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {self.HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+            prefix = f'{label_text},' if label_text else ''
+            cumulative = 0
+            for bound, bucket in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{label_text}}} {total}')
+            lines.append(f'{name}_count{{{label_text}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+registry = Registry()
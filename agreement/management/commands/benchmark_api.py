@@ -0,0 +1,135 @@
+import json
+import random
+import tempfile
+import time
+
+from django.core.cache import caches
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from agreement.benchmarks import (
+    build_report, compare_reports, format_benchmark, seed_agreements, summarize, unthrottled, write_report,
+)
+from agreement.models import LegalAgreement
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed LegalAgreement rows inside a rolled-back transaction and measure "
+        "latency percentiles, throughput and query counts of the agreement API "
+        "endpoints in-process. Results are written as JSON for diffing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--parties', type=int, default=1_000)
+        parser.add_argument('--rounds', type=int, default=200)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help="Baseline JSON report to diff against.")
+
+    def handle(self, *args, **options):
+        self.client = Client()
+        self.rounds = options['rounds']
+        benchmarks = []
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root,
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            **unthrottled(),
+        ):
+            try:
+                with transaction.atomic():
+                    self.addresses = seed_agreements(options['rows'], options['parties'])
+                    self.agreements = list(
+                        LegalAgreement.objects.order_by('?').values('id', 'access_token')[:self.rounds]
+                    )
+                    for name in ('create', 'retrieve', 'retrieve_cached', 'by_party',
+                                 'get_by_access_token', 'update_by_access_token', 'sign_agreement'):
+                        warmup = getattr(self, f'warmup_{name}', None)
+                        if warmup:
+                            warmup()
+                        benchmark = self.run(name, getattr(self, f'scenario_{name}'))
+                        self.stdout.write(format_benchmark(benchmark))
+                        benchmarks.append(benchmark)
+                    raise Rollback
+            except Rollback:
+                pass
+
+        report = build_report(benchmarks, {
+            'rows': options['rows'], 'parties': options['parties'], 'rounds': self.rounds,
+            'database': connection.vendor,
+        })
+        write_report(options['output'], report)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+            for line in compare_reports(baseline, report):
+                self.stdout.write(line)
+
+    def run(self, name, scenario):
+        timings, queries, errors = [], [], 0
+        for index in range(self.rounds):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = scenario(index)
+                timings.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+            queries.append(len(captured.captured_queries))
+        return summarize(name, timings, queries=queries, errors=errors)
+
+    def agreement(self, index):
+        return self.agreements[index % len(self.agreements)]
+
+    def scenario_create(self, index):
+        return self.client.post('/agreement/agreement/', {
+            'content': 'benchmark ' * 200,
+            'email': 'party@example.com',
+            'first_party_address': random.choice(self.addresses),
+            'second_party_address': random.choice(self.addresses),
+        })
+
+    def scenario_retrieve(self, index):
+        caches[settings.AGREEMENT_CACHE_ALIAS].clear()
+        return self.client.get(f"/agreement/agreement/{self.agreement(index)['id']}/")
+
+    def warmup_retrieve_cached(self):
+        for index in range(len(self.agreements)):
+            self.scenario_retrieve_cached(index)
+
+    def scenario_retrieve_cached(self, index):
+        return self.client.get(f"/agreement/agreement/{self.agreement(index)['id']}/")
+
+    def scenario_by_party(self, index):
+        return self.client.get('/agreement/agreement/by_party/', {'address': random.choice(self.addresses)})
+
+    def scenario_get_by_access_token(self, index):
+        caches[settings.AGREEMENT_CACHE_ALIAS].clear()
+        return self.client.get(
+            '/agreement/agreement/access_token/', {'access_token': str(self.agreement(index)['access_token'])}
+        )
+
+    def scenario_update_by_access_token(self, index):
+        token = self.agreement(index)['access_token']
+        return self.client.patch(
+            f'/agreement/agreement/update_by_access_token/?access_token={token}',
+            data='--boundary\r\nContent-Disposition: form-data; name="agreementType"\r\n\r\nupdated\r\n--boundary--\r\n',
+            content_type='multipart/form-data; boundary=boundary',
+        )
+
+    def scenario_sign_agreement(self, index):
+        signature = SimpleUploadedFile(f'sig{index}.png', random.randbytes(4096), content_type='image/png')
+        return self.client.post(
+            f"/agreement/agreement/{self.agreement(index)['id']}/sign/",
+            {'second_party_signature': signature},
+        )
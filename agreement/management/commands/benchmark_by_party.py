@@ -0,0 +1,91 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Q
+
+from agreement.models import LegalAgreement, normalize_address
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed LegalAgreement rows inside a rolled-back transaction and compare "
+        "by_party lookup latency for the legacy iexact query and the indexed "
+        "normalized-address query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--parties', type=int, default=50_000)
+        parser.add_argument('--lookups', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        database = options['database']
+        vendor = connections[database].vendor
+        self.stdout.write(f"Benchmarking by_party on {vendor} ({database}) with {options['rows']} rows")
+
+        try:
+            with transaction.atomic(using=database):
+                addresses = self.seed(database, options)
+                lookups = [random.choice(addresses) for _ in range(options['lookups'])]
+                self.report('legacy iexact', self.measure(database, lookups, self.legacy_queryset))
+                self.report('normalized index', self.measure(database, lookups, self.indexed_queryset))
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Seeded rows rolled back.")
+
+    def seed(self, database, options):
+        # Mixed-case addresses so the normalized lookup has real work to do
+        addresses = [f"0x{random.getrandbits(160):040X}" for _ in range(options['parties'])]
+        batch = []
+        for _ in range(options['rows']):
+            first, second = random.sample(addresses, 2)
+            batch.append(LegalAgreement(
+                content='benchmark',
+                agreementType='benchmark',
+                first_party_address=first,
+                second_party_address=second,
+                first_party_address_normalized=normalize_address(first),
+                second_party_address_normalized=normalize_address(second),
+            ))
+            if len(batch) >= options['batch_size']:
+                LegalAgreement.objects.using(database).bulk_create(batch)
+                batch = []
+        if batch:
+            LegalAgreement.objects.using(database).bulk_create(batch)
+        return addresses
+
+    def legacy_queryset(self, database, address):
+        return LegalAgreement.objects.using(database).filter(
+            Q(first_party_address__iexact=address) | Q(second_party_address__iexact=address)
+        )
+
+    def indexed_queryset(self, database, address):
+        address = normalize_address(address)
+        return LegalAgreement.objects.using(database).filter(
+            Q(first_party_address_normalized=address) | Q(second_party_address_normalized=address)
+        )
+
+    def measure(self, database, lookups, build_queryset):
+        timings = []
+        for address in lookups:
+            start = time.perf_counter()
+            list(build_queryset(database, address))
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:>18}: median {statistics.median(timings):.2f} ms, "
+            f"p95 {p95:.2f} ms, max {timings[-1]:.2f} ms"
+        )
@@ -0,0 +1,106 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import include, path
+
+from agreement import urls as agreement_urls
+from agreement.benchmarks import build_report, format_benchmark, seed_agreements, summarize, unthrottled, write_report
+from agreement.models import LegalAgreement
+
+# URLconf used for the ASGI run: the async read routes in front of the viewset
+urlpatterns = [
+    path('agreement/', include(agreement_urls.async_urlpatterns + agreement_urls.urlpatterns)),
+]
+
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'benchmark': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent read throughput of the WSGI stack (sync views on a "
+        "thread pool) with the ASGI stack (async views on one event loop) for "
+        "retrieve, get_by_access_token and by_party."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5_000)
+        parser.add_argument('--parties', type=int, default=500)
+        parser.add_argument('--requests', type=int, default=2_000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--cached', action='store_true', help="Keep the agreement cache enabled.")
+        parser.add_argument('--output', default='benchmark_concurrency.json')
+
+    def handle(self, *args, **options):
+        self.addresses = seed_agreements(options['rows'], options['parties'])
+        try:
+            agreements = list(LegalAgreement.objects.filter(agreementType='benchmark').values('id', 'access_token'))
+            self.paths = [self.random_path(agreements) for _ in range(options['requests'])]
+            cache_settings = {} if options['cached'] else {'CACHES': NO_CACHE, 'AGREEMENT_CACHE_ALIAS': 'benchmark'}
+
+            with override_settings(**cache_settings, **unthrottled()):
+                benchmarks = [
+                    self.run_wsgi(options['concurrency']),
+                    self.run_asgi(options['concurrency']),
+                ]
+        finally:
+            LegalAgreement.objects.filter(agreementType='benchmark').delete()
+
+        for benchmark in benchmarks:
+            self.stdout.write(format_benchmark(benchmark))
+        write_report(options['output'], build_report(benchmarks, {
+            'rows': options['rows'], 'requests': options['requests'],
+            'concurrency': options['concurrency'], 'cached': options['cached'],
+        }))
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def random_path(self, agreements):
+        agreement = random.choice(agreements)
+        return random.choice([
+            f"/agreement/agreement/{agreement['id']}/",
+            f"/agreement/agreement/access_token/?access_token={agreement['access_token']}",
+            f"/agreement/agreement/by_party/?address={random.choice(self.addresses)}&exclude=content",
+        ])
+
+    def run_wsgi(self, concurrency):
+        def call(url):
+            start = time.perf_counter()
+            response = Client().get(url)
+            return time.perf_counter() - start, response.status_code >= 400
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(call, self.paths))
+        elapsed = time.perf_counter() - start
+        return summarize(
+            f'wsgi_threads_{concurrency}', [duration for duration, _ in results],
+            elapsed=elapsed, errors=sum(failed for _, failed in results),
+        )
+
+    def run_asgi(self, concurrency):
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            client = AsyncClient()
+
+            async def call(url):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.get(url)
+                    return time.perf_counter() - start, response.status_code >= 400
+
+            return await asyncio.gather(*(call(url) for url in self.paths))
+
+        with override_settings(ROOT_URLCONF=__name__):
+            start = time.perf_counter()
+            results = asyncio.run(run())
+            elapsed = time.perf_counter() - start
+        return summarize(
+            f'asgi_tasks_{concurrency}', [duration for duration, _ in results],
+            elapsed=elapsed, errors=sum(failed for _, failed in results),
+        )
@@ -0,0 +1,90 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from agreement.benchmarks import agreement_text, seed_agreements
+from agreement.compression import RAW, compress, dictionary_checksum, train_dictionary
+from agreement.models import ContentDictionary, LegalAgreement
+
+TABLE = LegalAgreement._meta.db_table
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed agreements with template-like content inside a rolled-back "
+        "transaction and report table size and row-fetch time with content "
+        "stored plain, compressed, and compressed against a trained dictionary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20_000)
+        parser.add_argument('--rounds', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                seed_agreements(options['rows'], 500)
+                ids = LegalAgreement.objects.filter(agreementType='benchmark').values_list('id', flat=True)
+                self.texts = {pk: agreement_text() for pk in ids}
+                data = train_dictionary(list(self.texts.values())[:2000])
+                dictionary = (dictionary_checksum(data), data)
+                # Reads need the dictionary row; it goes with the rollback
+                ContentDictionary.objects.create(checksum=dictionary[0], data=data, sample_size=2000)
+
+                for label, encode in (
+                    ('plain', lambda text: RAW + text.encode('utf-8')),
+                    ('deflate', lambda text: compress(text, dictionary=None)),
+                    ('deflate + dictionary', lambda text: compress(text, dictionary=dictionary)),
+                ):
+                    self.store(encode)
+                    self.report(label, options['rounds'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Seeded rows rolled back.")
+
+    def store(self, encode):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {TABLE} SET content = %s WHERE id = %s',
+                [(encode(text), pk) for pk, text in self.texts.items()],
+            )
+
+    def report(self, label, rounds):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT SUM(LENGTH(content)) FROM {TABLE}')
+            content_bytes = cursor.fetchone()[0]
+        table = self.table_size()
+        deferred = self.fetch_time(rounds, LegalAgreement.objects.filter(agreementType='benchmark'))
+        full = self.fetch_time(rounds, LegalAgreement.objects.with_content().filter(agreementType='benchmark'))
+        rows = len(self.texts)
+        self.stdout.write(
+            f"{label:>21}: content {content_bytes / rows:7.1f} B/row, table {table}, "
+            f"fetch {full / rows * 1e6:6.2f} us/row with content, {deferred / rows * 1e6:6.2f} us/row deferred"
+        )
+
+    def table_size(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_total_relation_size(%s)', [TABLE])
+                return f"{cursor.fetchone()[0] / 1024 / 1024:.1f} MiB"
+            if connection.vendor == 'sqlite':
+                try:
+                    cursor.execute('SELECT SUM(payload) FROM dbstat WHERE name = %s', [TABLE])
+                except Exception:
+                    return 'n/a (no dbstat)'
+                return f"{cursor.fetchone()[0] / 1024 / 1024:.1f} MiB payload"
+        return 'n/a'
+
+    def fetch_time(self, rounds, queryset):
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            list(queryset.all())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,86 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from agreement.benchmarks import build_report, seed_agreements, summarize, write_report
+from agreement.models import LegalAgreement
+from agreement.queries import party_agreements
+from agreement.serializers import CompactAgreementSerializer, LegalAgreementSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed agreements inside a rolled-back transaction and compare the "
+        "per-row cost of LegalAgreementSerializer with the compact values() "
+        "fast path, with and without the database fetch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--output', default='benchmark_serializers.json')
+
+    def handle(self, *args, **options):
+        rows, rounds = options['rows'], options['rounds']
+        request = RequestFactory().get('/')
+        try:
+            with transaction.atomic():
+                # Two parties so a single lookup returns every seeded row
+                address = seed_agreements(rows, 2)[0]
+                LegalAgreement.objects.filter(agreementType='benchmark').update(
+                    first_party_valid_id=f"blobs/ab/{'ab' * 32}.webp",
+                    second_party_signature=f"blobs/cd/{'cd' * 32}.png",
+                    first_party_address=address,
+                    first_party_address_normalized=address.lower(),
+                )
+                benchmarks = [
+                    self.measure('model_serializer', rounds, rows, lambda: self.model_serializer(address, request)),
+                    self.measure('compact_serializer', rounds, rows, lambda: self.compact_serializer(address, request)),
+                ]
+                raise Rollback
+        except Rollback:
+            pass
+
+        for benchmark in benchmarks:
+            stats = benchmark['stats']
+            self.stdout.write(
+                f"{benchmark['name']:>20}: serialize {stats['serialize_us_per_row']:6.2f} us/row, "
+                f"fetch + serialize {stats['total_us_per_row']:6.2f} us/row"
+            )
+        write_report(options['output'], build_report(benchmarks, {'rows': rows, 'rounds': rounds}))
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def model_serializer(self, address, request):
+        start = time.perf_counter()
+        instances = list(party_agreements(address))
+        fetched = time.perf_counter()
+        LegalAgreementSerializer(instances, many=True, context={'request': request}).data
+        return fetched - start, time.perf_counter() - fetched, len(instances)
+
+    def compact_serializer(self, address, request):
+        start = time.perf_counter()
+        serializer = CompactAgreementSerializer(request=request)
+        rows = list(serializer.rows(party_agreements(address)))
+        fetched = time.perf_counter()
+        serializer.serialize(rows)
+        return fetched - start, time.perf_counter() - fetched, len(rows)
+
+    def measure(self, name, rounds, rows, run):
+        fetch_times, serialize_times = [], []
+        for _ in range(rounds):
+            fetch, serialize, count = run()
+            if count != rows:
+                raise RuntimeError(f"{name} returned {count} rows, expected {rows}")
+            fetch_times.append(fetch)
+            serialize_times.append(serialize)
+        benchmark = summarize(name, serialize_times)
+        serialize_best = min(serialize_times)
+        benchmark['stats']['serialize_us_per_row'] = serialize_best / rows * 1e6
+        benchmark['stats']['total_us_per_row'] = (serialize_best + min(fetch_times)) / rows * 1e6
+        return benchmark
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand
+
+from agreement.storage import UniqueUploadTo
+
+CHUNK = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare memory and wall time of the legacy save-then-rename upload path "
+        "with direct saving under a unique upload_to name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=20)
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as media_root:
+            storage = FileSystemStorage(location=media_root)
+            for label, save in (('legacy rename', self.save_legacy), ('unique upload_to', self.save_direct)):
+                timings, peaks = [], []
+                for _ in range(options['runs']):
+                    upload = self.make_upload(options['size_mb'])
+                    tracemalloc.start()
+                    start = time.perf_counter()
+                    save(storage, upload)
+                    timings.append(time.perf_counter() - start)
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                    upload.close()
+                self.stdout.write(
+                    f"{label:>17}: {min(timings) * 1000:.1f} ms best, "
+                    f"{max(peaks) / CHUNK:.1f} MiB peak Python allocations"
+                )
+
+    def make_upload(self, size_mb):
+        # Mirrors what Django hands the view for uploads above FILE_UPLOAD_MAX_MEMORY_SIZE
+        upload = TemporaryUploadedFile('scan.jpg', 'image/jpeg', size_mb * CHUNK, None)
+        for _ in range(size_mb):
+            upload.write(os.urandom(CHUNK))
+        upload.seek(0)
+        return upload
+
+    def save_legacy(self, storage, upload):
+        name = storage.save(f"valid_ids/{upload.name}", upload)
+        path = storage.path(name)
+        with open(path, 'rb') as file:
+            content = file.read()
+        os.remove(path)
+        storage.save(f"valid_ids/{uuid.uuid4()}.jpg", ContentFile(content))
+
+    def save_direct(self, storage, upload):
+        storage.save(UniqueUploadTo('valid_ids/')(None, upload.name), upload)
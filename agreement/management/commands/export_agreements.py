@@ -0,0 +1,42 @@
+import os
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from agreement.export import FORMATS, AgreementExport
+
+
+class Command(BaseCommand):
+    help = (
+        "Export every agreement as gzipped NDJSON or CSV, optionally as a tar "
+        "archive with the referenced files. Resume an interrupted export "
+        "with --after set to the last id it reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or - for stdout.")
+        parser.add_argument('--output-format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--media', action='store_true', help="Bundle referenced files into a tar archive.")
+        parser.add_argument('--after', type=int, default=0, help="Only export agreements with a greater id.")
+        parser.add_argument('--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE)
+        parser.add_argument('--database', default=None, help="Database alias to read from, e.g. the replica.")
+
+    def handle(self, *args, **options):
+        export = AgreementExport(
+            options['output_format'], options['after'], options['media'], options['chunk_size'], options['database'],
+        )
+        path = options['path']
+        if path != '-' and os.path.exists(path):
+            raise CommandError(f"{path} already exists.")
+
+        target = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        try:
+            for data in export.stream():
+                target.write(data)
+        finally:
+            if target is not sys.stdout.buffer:
+                target.close()
+            # Never mixed into an export written to stdout
+            out = self.stderr if path == '-' else self.stdout
+            out.write(f"Exported {export.count} agreements; last id {export.last_id}")
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from custosBackend.docs import generate_schema, write_schema
+
+
+class Command(BaseCommand):
+    help = "Write the API schema to API_SCHEMA_CACHE_PATH so the docs serve it without generating it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.API_SCHEMA_CACHE_PATH)
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError("Set API_SCHEMA_CACHE_PATH or pass --path.")
+        data = generate_schema()
+        write_schema(options['path'], data)
+        self.stdout.write(f"Wrote {len(data)} bytes to {options['path']}")
@@ -0,0 +1,148 @@
+import json
+import random
+import threading
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from agreement.benchmarks import (
+    build_report, compare_reports, format_benchmark, random_address, summarize, write_report,
+)
+
+# Relative weights of the simulated client actions
+TASKS = {
+    'retrieve': 4,
+    'get_by_access_token': 4,
+    'by_party': 2,
+    'update_by_access_token': 1,
+    'create': 1,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Locust-style load test against a running server (runserver, gunicorn or "
+        "uvicorn): concurrent users run a weighted mix of agreement API calls for "
+        "a fixed duration and per-endpoint latency percentiles are written as JSON. "
+        "The target server's rate limits apply, so raise THROTTLE_ACCESS_TOKEN_RATE, "
+        "THROTTLE_PARTY_CLIENT_RATE and THROTTLE_PARTY_ADDRESS_RATE there "
+        "(e.g. 1000000/min) before a run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=30.0)
+        parser.add_argument('--seed', type=int, default=200, help="Agreements created through bulk_create before the run.")
+        parser.add_argument('--parties', type=int, default=50)
+        parser.add_argument('--output', default='load_test.json')
+        parser.add_argument('--compare', help="Baseline JSON report to diff against.")
+
+    def handle(self, *args, **options):
+        self.base = options['url'].rstrip('/') + '/agreement/agreement/'
+        self.addresses = [random_address() for _ in range(options['parties'])]
+        self.agreements = self.seed(options['seed'])
+
+        self.lock = threading.Lock()
+        self.timings = {name: [] for name in TASKS}
+        self.errors = {name: 0 for name in TASKS}
+        self.throttled = 0
+        deadline = time.monotonic() + options['duration']
+
+        users = [
+            threading.Thread(target=self.user, args=(deadline,), daemon=True)
+            for _ in range(options['users'])
+        ]
+        started = time.monotonic()
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.monotonic() - started
+
+        benchmarks = [
+            summarize(name, self.timings[name], elapsed=elapsed, errors=self.errors[name])
+            for name in TASKS
+        ]
+        for benchmark in benchmarks:
+            self.stdout.write(format_benchmark(benchmark))
+        if self.throttled:
+            self.stderr.write(
+                f"{self.throttled} requests were rate limited (429); raise the server's "
+                "THROTTLE_*_RATE settings for meaningful results."
+            )
+
+        report = build_report(benchmarks, {
+            'url': options['url'], 'users': options['users'], 'duration': options['duration'],
+            'seed': options['seed'],
+        })
+        write_report(options['output'], report)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+            for line in compare_reports(baseline, report):
+                self.stdout.write(line)
+
+    def seed(self, count):
+        agreements = []
+        for offset in range(0, count, 500):
+            payload = [self.payload() for _ in range(min(500, count - offset))]
+            response = requests.post(self.base + 'bulk_create/', json=payload, timeout=60)
+            if response.status_code != 201:
+                raise CommandError(f"Seeding failed ({response.status_code}): {response.text[:500]}")
+            agreements.extend(
+                (item['agreement']['id'], item['access_token']) for item in response.json()
+            )
+        return agreements
+
+    def payload(self):
+        first, second = random.sample(self.addresses, 2)
+        return {
+            'content': 'load test ' * 200,
+            'agreementType': 'load_test',
+            'first_party_address': first,
+            'second_party_address': second,
+        }
+
+    def user(self, deadline):
+        session = requests.Session()
+        names, weights = list(TASKS), list(TASKS.values())
+        while time.monotonic() < deadline:
+            name = random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = getattr(self, f'task_{name}')(session)
+                failed = response.status_code >= 400
+                throttled = response.status_code == 429
+            except requests.RequestException:
+                failed, throttled = True, False
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.timings[name].append(duration)
+                if failed:
+                    self.errors[name] += 1
+                self.throttled += throttled
+
+    def task_retrieve(self, session):
+        agreement_id, _ = random.choice(self.agreements)
+        return session.get(f'{self.base}{agreement_id}/', timeout=30)
+
+    def task_get_by_access_token(self, session):
+        _, token = random.choice(self.agreements)
+        return session.get(self.base + 'access_token/', params={'access_token': token}, timeout=30)
+
+    def task_by_party(self, session):
+        return session.get(self.base + 'by_party/', params={'address': random.choice(self.addresses)}, timeout=30)
+
+    def task_update_by_access_token(self, session):
+        _, token = random.choice(self.agreements)
+        return session.patch(
+            self.base + 'update_by_access_token/', params={'access_token': token},
+            files={'agreementType': (None, 'load_test_updated')}, timeout=30,
+        )
+
+    def task_create(self, session):
+        return session.post(self.base, data=self.payload(), timeout=30)
@@ -0,0 +1,64 @@
+import os
+import re
+import subprocess
+import sys
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before serving its first request: set Django up and
+# load the URLconf (which imports every view module)
+BOOT = (
+    "import time; start = time.perf_counter(); "
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns; "
+    "print(time.perf_counter() - start)"
+)
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot Django and load the URLconf in fresh interpreters with "
+        "-X importtime, and report startup time and the slowest imports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Boots to time; the fastest is reported.")
+        parser.add_argument('--top', type=int, default=15)
+
+    def handle(self, *args, **options):
+        timings, imports = [], None
+        for _ in range(options['runs']):
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', BOOT],
+                capture_output=True, text=True, env=os.environ.copy(),
+            )
+            if result.returncode:
+                raise CommandError(result.stderr.strip().splitlines()[-1])
+            timings.append(float(result.stdout.strip().splitlines()[-1]))
+            imports = self.parse(result.stderr)
+
+        self.stdout.write(f"Startup: {min(timings) * 1000:.1f} ms (best of {len(timings)})")
+
+        packages = Counter()
+        for name, (own, _) in imports.items():
+            packages[name.split('.')[0]] += own
+        self.stdout.write("\nSlowest packages (own import time, ms):")
+        for name, total in packages.most_common(options['top']):
+            self.stdout.write(f"  {total / 1000:8.1f}  {name}")
+
+        self.stdout.write("\nSlowest modules (including what they import, ms):")
+        slowest = sorted(imports.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (_, cumulative) in slowest[:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f}  {name}")
+
+    def parse(self, output):
+        # module -> (own microseconds, cumulative microseconds)
+        imports = {}
+        for line in output.splitlines():
+            match = IMPORT_LINE.match(line)
+            if match:
+                imports[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+        return imports
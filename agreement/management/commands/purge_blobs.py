@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from agreement.uploads import purge_orphan_blobs
+
+
+class Command(BaseCommand):
+    help = "Delete blobs that no agreement has referenced within BLOB_ORPHAN_TTL of being stored, with their files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.BLOB_ORPHAN_TTL, help="Age in seconds.")
+
+    def handle(self, *args, **options):
+        purged = purge_orphan_blobs(options['max_age'])
+        self.stdout.write(f"Deleted {purged} unreferenced blobs")
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from agreement.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.IDEMPOTENCY_KEY_TTL, help="Age in seconds.")
+
+    def handle(self, *args, **options):
+        purged = purge_expired_keys(options['max_age'])
+        self.stdout.write(f"Deleted {purged} expired idempotency keys")
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from agreement.uploads import purge_stale_sessions
+
+
+class Command(BaseCommand):
+    help = "Discard resumable uploads that have not received a chunk within UPLOAD_SESSION_TTL, with their part files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.UPLOAD_SESSION_TTL, help="Age in seconds.")
+
+    def handle(self, *args, **options):
+        purged = purge_stale_sessions(options['max_age'])
+        self.stdout.write(f"Discarded {purged} stale uploads")
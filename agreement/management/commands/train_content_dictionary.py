@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from agreement.compression import MAX_DICTIONARY_SIZE, compress, dictionary_checksum, train_dictionary
+from agreement.models import ContentDictionary, LegalAgreement
+
+
+class Command(BaseCommand):
+    help = (
+        "Train a compression dictionary on the newest agreements and make it "
+        "the one used for new writes. Existing rows keep the dictionary they "
+        "were written with; other processes pick the new one up on restart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=2000, help="Number of recent agreements to learn from.")
+        parser.add_argument('--size', type=int, default=MAX_DICTIONARY_SIZE)
+
+    def handle(self, *args, **options):
+        samples = list(
+            LegalAgreement.objects.order_by('-id').values_list('content', flat=True)[:options['sample']]
+        )
+        data = train_dictionary(samples, options['size'])
+        if not data:
+            raise CommandError("The sampled agreements share no recurring passages to learn from.")
+
+        checksum = dictionary_checksum(data)
+        dictionary, created = ContentDictionary.objects.get_or_create(
+            checksum=checksum, defaults={'data': data, 'sample_size': len(samples)}
+        )
+        if not created:
+            self.stdout.write(f"{dictionary} already exists.")
+            return
+
+        plain = sum(len(text.encode('utf-8')) for text in samples)
+        without = sum(len(compress(text, dictionary=None)) for text in samples)
+        with_dictionary = sum(len(compress(text, dictionary=(checksum, data))) for text in samples)
+        self.stdout.write(
+            f"Stored {dictionary} trained on {len(samples)} agreements: "
+            f"{plain} bytes plain, {without} compressed, {with_dictionary} with the dictionary"
+        )
@@ -0,0 +1,176 @@
+"""
+Serving of agreement files: HTTP Range, ETag/Last-Modified validation and,
+when MEDIA_SENDFILE is configured, offload of the transfer to the front
+web server via X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd).
+
+Files are only reachable through the agreement `files/<field>/` endpoint,
+with the agreement's access token or with the signed, expiring URL that
+representations served to the token holder carry. The signature covers the
+stored file's name, so a link stops working once the file is replaced.
+"""
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import http_date, parse_http_date_safe
+
+from .instrumentation import timed
+from .storage import blob_digest
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def url_expiry(now=None):
+    """
+    Expiry stamp for file URLs issued now: between FILE_URL_MAX_AGE and
+    twice that ahead, and fixed within each window so cached
+    representations and their ETags stay stable.
+    """
+    window = settings.FILE_URL_MAX_AGE
+    return (int(now or time.time()) // window + 2) * window
+
+
+def file_signature(agreement_id, field, name, expires):
+    return salted_hmac('agreement.media.file_url', f'{agreement_id}:{field}:{name}:{expires}').hexdigest()
+
+
+def file_url(base, agreement_id, field, name, expires, variant=None):
+    """
+    Signed URL of the file `name` stored in an agreement field; `base` is
+    the agreement list URL.
+    """
+    signature = file_signature(agreement_id, field, name, expires)
+    url = f'{base}{agreement_id}/files/{field}/?expires={expires}&signature={signature}'
+    return f'{url}&variant={variant}' if variant else url
+
+
+def valid_file_signature(agreement_id, field, name, expires, signature):
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return constant_time_compare(signature or '', file_signature(agreement_id, field, name, expires))
+
+
+def file_etag(name, stat):
+    # Blob names carry the SHA-256 of their bytes, which is the ideal strong validator
+    digest = blob_digest(name)
+    if digest:
+        return f'"{digest}"'
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    (start, end) byte positions, inclusive, for a single-range `Range`
+    header; None to send the whole file (no, malformed or multi-range
+    header); False when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def range_applies(request, etag, last_modified):
+    """
+    Honour `If-Range`: a range is only served while the client's copy is current.
+    """
+    validator = request.headers.get('If-Range')
+    if not validator:
+        return True
+    if validator.startswith(('"', 'W/')):
+        return validator == etag
+    since = parse_http_date_safe(validator)
+    return since is not None and int(last_modified) <= since
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def sendfile_response(name, path):
+    mode = settings.MEDIA_SENDFILE
+    response = HttpResponse()
+    if mode == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(settings.MEDIA_SENDFILE_PREFIX + name)
+    else:
+        response['X-Sendfile'] = path
+    # Let the web server supply the type and handle Range itself
+    del response['Content-Type']
+    return response
+
+
+def serve_file(request, storage, name):
+    """
+    Response for the stored file `name`, or None when it doesn't exist.
+    """
+    with timed('storage'):
+        path = storage.path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    etag = file_etag(name, stat)
+    last_modified = stat.st_mtime
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if response is None:
+        if settings.MEDIA_SENDFILE:
+            response = sendfile_response(name, path)
+        else:
+            response = stream_file(request, path, stat.st_size, etag, last_modified)
+
+    content_type, _ = mimetypes.guess_type(name)
+    if response.status_code in (200, 206) and 'Content-Type' in response:
+        response['Content-Type'] = content_type or 'application/octet-stream'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def stream_file(request, path, size, etag, last_modified):
+    byte_range = None
+    if range_applies(request, etag, last_modified):
+        byte_range = parse_range(request.headers.get('Range'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        # A whole-file FileResponse lets the WSGI server use sendfile(2)
+        response = FileResponse(open(path, 'rb'))
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(path, start, end - start + 1), status=206)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,57 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .instrumentation import collect, registry
+
+logger = logging.getLogger('agreement.performance')
+
+
+class PerformanceMiddleware:
+    """
+    Time every request and break it down into DB, storage, mail and
+    serializer phases. The breakdown is returned in a Server-Timing header,
+    logged as one JSON line and folded into the metrics histograms.
+    Works in both sync (WSGI) and async (ASGI) middleware chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, total):
+        view = request.resolver_match.view_name if request.resolver_match else 'unresolved'
+        response['Server-Timing'] = metrics.server_timing(total)
+        registry.observe_request(view, total, metrics)
+        logger.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 2),
+            'phases': {
+                phase: {'count': count, 'duration_ms': round(duration * 1000, 2)}
+                for phase, (count, duration) in metrics.phases.items()
+            },
+        }))
+        return response
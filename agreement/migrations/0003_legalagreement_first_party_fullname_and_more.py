@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0002_remove_legalagreement_first_party_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='legalagreement',
+            name='first_party_fullname',
+            field=models.CharField(max_length=1000, null=True),
+        ),
+        migrations.AddField(
+            model_name='legalagreement',
+            name='second_party_fullname',
+            field=models.CharField(max_length=1000, null=True),
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='first_party_valid_id',
+            field=models.ImageField(blank=True, null=True, upload_to='valid_ids/'),
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='second_party_valid_id',
+            field=models.ImageField(blank=True, null=True, upload_to='valid_ids/'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+
+def backfill_normalized_addresses(apps, schema_editor):
+    LegalAgreement = apps.get_model('agreement', 'LegalAgreement')
+    db_alias = schema_editor.connection.alias
+    batch = []
+    queryset = LegalAgreement.objects.using(db_alias).only(
+        'id', 'first_party_address', 'second_party_address'
+    )
+    for agreement in queryset.iterator(chunk_size=2000):
+        agreement.first_party_address_normalized = (agreement.first_party_address or '').strip().lower()
+        agreement.second_party_address_normalized = (agreement.second_party_address or '').strip().lower()
+        batch.append(agreement)
+        if len(batch) >= 2000:
+            LegalAgreement.objects.using(db_alias).bulk_update(
+                batch, ['first_party_address_normalized', 'second_party_address_normalized']
+            )
+            batch = []
+    if batch:
+        LegalAgreement.objects.using(db_alias).bulk_update(
+            batch, ['first_party_address_normalized', 'second_party_address_normalized']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0003_legalagreement_first_party_fullname_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='legalagreement',
+            name='first_party_address_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='legalagreement',
+            name='second_party_address_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_normalized_addresses, migrations.RunPython.noop),
+    ]
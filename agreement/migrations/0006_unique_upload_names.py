@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:55
+
+import agreement.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0005_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='first_party_signature',
+            field=models.FileField(blank=True, null=True, upload_to=agreement.storage.UniqueUploadTo('signatures/')),
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='first_party_valid_id',
+            field=models.ImageField(blank=True, null=True, upload_to=agreement.storage.UniqueUploadTo('valid_ids/')),
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='second_party_signature',
+            field=models.FileField(blank=True, null=True, upload_to=agreement.storage.UniqueUploadTo('signatures/')),
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='second_party_valid_id',
+            field=models.ImageField(blank=True, null=True, upload_to=agreement.storage.UniqueUploadTo('valid_ids/')),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+import agreement.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0006_unique_upload_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='first_party_signature',
+            field=models.FileField(blank=True, null=True, storage=agreement.storage.BlobStorage(), upload_to=agreement.storage.UniqueUploadTo('signatures/')),
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='first_party_valid_id',
+            field=models.ImageField(blank=True, null=True, storage=agreement.storage.BlobStorage(), upload_to=agreement.storage.UniqueUploadTo('valid_ids/')),
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='second_party_signature',
+            field=models.FileField(blank=True, null=True, storage=agreement.storage.BlobStorage(), upload_to=agreement.storage.UniqueUploadTo('signatures/')),
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='second_party_valid_id',
+            field=models.ImageField(blank=True, null=True, storage=agreement.storage.BlobStorage(), upload_to=agreement.storage.UniqueUploadTo('valid_ids/')),
+        ),
+    ]
@@ -0,0 +1,95 @@
+from django.db import migrations
+
+TABLE = 'agreement_legalagreement'
+FTS_TABLE = 'agreement_legalagreement_fts'
+INDEXED_COLUMNS = 'content, "agreementType", first_party_fullname, second_party_fullname'
+
+POSTGRES_VECTOR = """
+    setweight(to_tsvector('english', coalesce({row}"agreementType", '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}first_party_fullname, '') || ' ' ||
+                                     coalesce({row}second_party_fullname, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce({row}content, '')), 'C')
+"""
+
+POSTGRES_FORWARDS = [
+    f'ALTER TABLE {TABLE} ADD COLUMN search_vector tsvector',
+    f"""
+    CREATE FUNCTION agreement_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {POSTGRES_VECTOR.format(row='NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE TRIGGER agreement_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF {INDEXED_COLUMNS} ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION agreement_search_vector_update()
+    """,
+    f'UPDATE {TABLE} SET search_vector = {POSTGRES_VECTOR.format(row="")}',
+    f'CREATE INDEX agreement_search_vector_idx ON {TABLE} USING gin (search_vector)',
+]
+
+POSTGRES_BACKWARDS = [
+    f'DROP TRIGGER IF EXISTS agreement_search_vector_trigger ON {TABLE}',
+    'DROP FUNCTION IF EXISTS agreement_search_vector_update()',
+    f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_NEW_ROW = 'new.id, new.content, new."agreementType", new.first_party_fullname, new.second_party_fullname'
+SQLITE_OLD_ROW = 'old.id, old.content, old."agreementType", old.first_party_fullname, old.second_party_fullname'
+
+SQLITE_FORWARDS = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        {INDEXED_COLUMNS}, content='{TABLE}', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {INDEXED_COLUMNS}) VALUES ({SQLITE_NEW_ROW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {INDEXED_COLUMNS}) VALUES ('delete', {SQLITE_OLD_ROW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF {INDEXED_COLUMNS} ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {INDEXED_COLUMNS}) VALUES ('delete', {SQLITE_OLD_ROW});
+        INSERT INTO {FTS_TABLE}(rowid, {INDEXED_COLUMNS}) VALUES ({SQLITE_NEW_ROW});
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def run_for_vendor(postgres, sqlite):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        statements = postgres if vendor == 'postgresql' else sqlite if vendor == 'sqlite' else []
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0007_blob_store'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARDS, SQLITE_FORWARDS),
+            run_for_vendor(POSTGRES_BACKWARDS, SQLITE_BACKWARDS),
+        ),
+    ]
@@ -0,0 +1,176 @@
+import importlib
+
+import agreement.compression
+from django.db import migrations, models
+
+TABLE = 'agreement_legalagreement'
+FTS_TABLE = 'agreement_legalagreement_fts'
+TEXT_COLUMNS = '"agreementType", first_party_fullname, second_party_fullname'
+
+search_index_0008 = importlib.import_module('agreement.migrations.0008_agreement_search_index')
+
+POSTGRES_VECTOR = """
+    setweight(to_tsvector('english', coalesce({row}"agreementType", '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}first_party_fullname, '') || ' ' ||
+                                     coalesce({row}second_party_fullname, '')), 'B') ||
+    setweight(coalesce({row}content_vector, ''::tsvector), 'C')
+"""
+
+# Content becomes unreadable to the database, so its part of the index is
+# built from the plain text now and maintained by the application afterwards
+POSTGRES_CONTENT_INDEX = [
+    f'ALTER TABLE {TABLE} ADD COLUMN content_vector tsvector',
+    f"UPDATE {TABLE} SET content_vector = to_tsvector('english', coalesce(content, ''))",
+]
+
+POSTGRES_TRIGGER = [
+    f"""
+    CREATE OR REPLACE FUNCTION agreement_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {POSTGRES_VECTOR.format(row='NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE TRIGGER agreement_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF {TEXT_COLUMNS}, content_vector ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION agreement_search_vector_update()
+    """,
+    f'UPDATE {TABLE} SET search_vector = {POSTGRES_VECTOR.format(row="")}',
+]
+
+POSTGRES_DROP_TRIGGER = [
+    f'DROP TRIGGER IF EXISTS agreement_search_vector_trigger ON {TABLE}',
+    'DROP FUNCTION IF EXISTS agreement_search_vector_update()',
+]
+
+SQLITE_CONTENT_INDEX = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        content, {TEXT_COLUMNS}, tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    INSERT INTO {FTS_TABLE}(rowid, content, {TEXT_COLUMNS})
+    SELECT id, content, {TEXT_COLUMNS} FROM {TABLE}
+    """,
+]
+
+SQLITE_DROP_CONTENT_INDEX = [f'DROP TABLE IF EXISTS {FTS_TABLE}']
+
+# Created last: rebuilding the table for the field changes drops triggers
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {TEXT_COLUMNS})
+        VALUES (new.id, new."agreementType", new.first_party_fullname, new.second_party_fullname);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {TABLE} BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF {TEXT_COLUMNS} ON {TABLE} BEGIN
+        UPDATE {FTS_TABLE} SET
+            "agreementType" = new."agreementType",
+            first_party_fullname = new.first_party_fullname,
+            second_party_fullname = new.second_party_fullname
+        WHERE rowid = new.id;
+    END
+    """,
+]
+
+SQLITE_DROP_TRIGGERS = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+]
+
+
+def run_for_vendor(postgres, sqlite):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        statements = postgres if vendor == 'postgresql' else sqlite if vendor == 'sqlite' else []
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+def copy_content(source, target):
+    def copy(apps, schema_editor):
+        LegalAgreement = apps.get_model('agreement', 'LegalAgreement')
+        db_alias = schema_editor.connection.alias
+        batch = []
+        for agreement in LegalAgreement.objects.using(db_alias).only('id', source).iterator(chunk_size=2000):
+            setattr(agreement, target, getattr(agreement, source) or '')
+            batch.append(agreement)
+            if len(batch) >= 2000:
+                LegalAgreement.objects.using(db_alias).bulk_update(batch, [target])
+                batch = []
+        if batch:
+            LegalAgreement.objects.using(db_alias).bulk_update(batch, [target])
+    return copy
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0008_agreement_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checksum', models.BigIntegerField(unique=True)),
+                ('data', models.BinaryField()),
+                ('sample_size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(
+            run_for_vendor(search_index_0008.POSTGRES_BACKWARDS[:2], search_index_0008.SQLITE_BACKWARDS),
+            run_for_vendor(search_index_0008.POSTGRES_FORWARDS[1:3], search_index_0008.SQLITE_FORWARDS),
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_CONTENT_INDEX, SQLITE_CONTENT_INDEX),
+            run_for_vendor([f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS content_vector'], SQLITE_DROP_CONTENT_INDEX),
+        ),
+        migrations.AddField(
+            model_name='legalagreement',
+            name='content_compressed',
+            field=agreement.compression.CompressedTextField(null=True),
+        ),
+        # Nullable so the column can be re-added when migrating backwards
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='content',
+            field=models.TextField(null=True),
+        ),
+        migrations.RunPython(
+            copy_content('content', 'content_compressed'),
+            copy_content('content_compressed', 'content'),
+        ),
+        migrations.RemoveField(
+            model_name='legalagreement',
+            name='content',
+        ),
+        migrations.RenameField(
+            model_name='legalagreement',
+            old_name='content_compressed',
+            new_name='content',
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='content',
+            field=agreement.compression.CompressedTextField(),
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_TRIGGER, SQLITE_TRIGGERS),
+            run_for_vendor(POSTGRES_DROP_TRIGGER, SQLITE_DROP_TRIGGERS),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:20
+
+import agreement.compression
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0009_compressed_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='legalagreement',
+            name='variables',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='content',
+            field=agreement.compression.CompressedTextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='AgreementTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agreementType', models.CharField(db_index=True, max_length=300)),
+                ('version', models.PositiveIntegerField(default=1, editable=False)),
+                ('body', models.TextField()),
+                ('variables', models.JSONField(default=list, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('agreementType', 'version'), name='template_type_version_uniq')],
+            },
+        ),
+        migrations.AddField(
+            model_name='legalagreement',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='agreements', to='agreement.agreementtemplate'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:29
+
+import importlib
+
+from django.db import migrations, models
+
+compressed_content_0009 = importlib.import_module('agreement.migrations.0009_compressed_content')
+
+# Adding a NOT NULL column rebuilds the table on SQLite, which drops the
+# search index triggers; they are put back after the rebuild either way
+reinstall_sqlite_triggers = compressed_content_0009.run_for_vendor(
+    [], compressed_content_0009.SQLITE_DROP_TRIGGERS + compressed_content_0009.SQLITE_TRIGGERS,
+)
+
+
+def mark_signed(apps, schema_editor):
+    LegalAgreement = apps.get_model('agreement', 'LegalAgreement')
+    LegalAgreement.objects.using(schema_editor.connection.alias).exclude(
+        second_party_signature__isnull=True,
+    ).exclude(second_party_signature='').update(signing_status='signed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0011_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, reinstall_sqlite_triggers),
+        migrations.AddField(
+            model_name='legalagreement',
+            name='signing_status',
+            field=models.CharField(choices=[('pending', 'Awaiting second-party signature'), ('signed', 'Signed by the second party')], default='pending', editable=False, max_length=10),
+        ),
+        migrations.RunPython(mark_signed, migrations.RunPython.noop),
+        migrations.RunPython(reinstall_sqlite_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='legalagreement',
+            index=models.Index(condition=models.Q(('signing_status', 'pending')), fields=['first_party_address_normalized', '-created_at', '-id'], name='agreement_first_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='legalagreement',
+            index=models.Index(condition=models.Q(('signing_status', 'pending')), fields=['second_party_address_normalized', '-created_at', '-id'], name='agreement_second_pending_idx'),
+        ),
+    ]
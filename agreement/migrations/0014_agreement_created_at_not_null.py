@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+import importlib
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+
+compressed_content_0009 = importlib.import_module('agreement.migrations.0009_compressed_content')
+
+# Making the column NOT NULL rebuilds the table on SQLite, which drops the
+# search index triggers; they are put back after the rebuild either way
+reinstall_sqlite_triggers = compressed_content_0009.run_for_vendor(
+    [], compressed_content_0009.SQLITE_DROP_TRIGGERS + compressed_content_0009.SQLITE_TRIGGERS,
+)
+
+
+def backfill_created_at(apps, schema_editor):
+    # Rows saved without a timestamp are dated with the oldest known one, so
+    # they page among the oldest agreements, in id order
+    LegalAgreement = apps.get_model('agreement', 'LegalAgreement')
+    agreements = LegalAgreement.objects.using(schema_editor.connection.alias)
+    missing = agreements.filter(created_at__isnull=True)
+    if missing.exists():
+        oldest = agreements.aggregate(oldest=Min('created_at'))['oldest']
+        missing.update(created_at=oldest or timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0013_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.RunPython(migrations.RunPython.noop, reinstall_sqlite_triggers),
+        migrations.AlterField(
+            model_name='legalagreement',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.RunPython(reinstall_sqlite_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+import importlib
+
+from django.db import migrations
+
+from agreement.rendering import Bindings, compile_template
+
+compressed_content_0009 = importlib.import_module('agreement.migrations.0009_compressed_content')
+
+TABLE = compressed_content_0009.TABLE
+FTS_TABLE = compressed_content_0009.FTS_TABLE
+TEXT_COLUMNS = compressed_content_0009.TEXT_COLUMNS
+
+# A contentless table keeps only the index, not another uncompressed copy of
+# the text. Deleting from one needs SQLite 3.43; older versions keep the
+# stored table, which the application maintains the same way.
+SQLITE_CONTENTLESS_INDEX = f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        content, {TEXT_COLUMNS}, tokenize='porter unicode61', content='', contentless_delete=1
+    )
+"""
+
+# Contentless rows can only be written whole, so the application indexes
+# every row it writes (agreement.search.index_content); deletes stay in SQL
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {TABLE} BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+]
+
+SQLITE_DROP_TRIGGERS = [f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete']
+
+
+def create_index(contentless):
+    def create(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in compressed_content_0009.SQLITE_DROP_TRIGGERS + SQLITE_DROP_TRIGGERS:
+            schema_editor.execute(statement)
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        if contentless and schema_editor.connection.Database.sqlite_version_info >= (3, 43):
+            schema_editor.execute(SQLITE_CONTENTLESS_INDEX)
+        else:
+            schema_editor.execute(compressed_content_0009.SQLITE_CONTENT_INDEX[0])
+        fill_index(apps, schema_editor)
+        triggers = SQLITE_TRIGGERS if contentless else compressed_content_0009.SQLITE_TRIGGERS
+        for statement in triggers:
+            schema_editor.execute(statement)
+    return create
+
+
+def fill_index(apps, schema_editor):
+    # Content is compressed and may be templated, so the text is rendered here
+    LegalAgreement = apps.get_model('agreement', 'LegalAgreement')
+    AgreementTemplate = apps.get_model('agreement', 'AgreementTemplate')
+    db_alias = schema_editor.connection.alias
+    templates = {
+        pk: compile_template(body)
+        for pk, body in AgreementTemplate.objects.using(db_alias).values_list('id', 'body')
+    }
+    columns = ('id', 'content', 'template_id', 'variables', 'agreementType', 'first_party_fullname', 'second_party_fullname')
+    sql = f'INSERT INTO {FTS_TABLE}(rowid, content, {TEXT_COLUMNS}) VALUES (%s, %s, %s, %s, %s)'
+    rows = LegalAgreement.objects.using(db_alias).values_list(*columns).iterator(chunk_size=2000)
+    with schema_editor.connection.cursor() as cursor:
+        batch = []
+        for pk, content, template_id, variables, *text in rows:
+            if template_id is not None:
+                content = templates[template_id].format_map(Bindings(variables or {}))
+            batch.append((pk, content, *text))
+            if len(batch) >= 2000:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agreement', '0014_agreement_created_at_not_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index(contentless=True), create_index(contentless=False)),
+    ]
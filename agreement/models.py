@@ -1,8 +1,155 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from functools import partial
 import uuid
 
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import forget_token, invalidate_agreement
+from .compression import CompressedTextField, clear_dictionary_cache
+from .images import delete_thumbnails, normalize_image, schedule_thumbnails
+from .rendering import clear_template_cache, render_template, template_variables
+from .search import index_content, indexed_fields
+from .storage import UniqueUploadTo, blob_digest, blob_storage
+from .tokenfilter import remember_tokens
+
+
+def normalize_address(address):
+    """
+    Canonical form of a wallet address used for indexed lookups.
+    Checksummed (mixed-case) addresses compare equal to their lowercase form.
+    """
+    return (address or '').strip().lower()
+
+
+class Blob(models.Model):
+    """
+    A file in the content-addressed blob store, shared by every agreement
+    field that references the same bytes.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+    @classmethod
+    def acquire(cls, name):
+        digest = blob_digest(name)
+        if not digest:
+            return
+        blob, _ = cls.objects.get_or_create(
+            sha256=digest, defaults={'name': name, 'size': blob_storage.size(name)}
+        )
+        cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+    @classmethod
+    def release(cls, name):
+        """
+        Drop one reference; the file is deleted once the last one goes.
+        """
+        digest = blob_digest(name)
+        if not digest:
+            return
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(sha256=digest).first()
+            if blob is None:
+                return
+            if blob.ref_count > 1:
+                cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+                return
+            blob.delete()
+            transaction.on_commit(lambda: cls.delete_orphan(digest, blob.name))
+
+    @classmethod
+    def delete_orphan(cls, digest, name):
+        # A concurrent upload may have re-registered the same bytes meanwhile
+        if not cls.objects.filter(sha256=digest).exists():
+            blob_storage.delete(name)
+            delete_thumbnails(name)
+
+
+class ContentDictionary(models.Model):
+    """
+    Preset compression dictionary for agreement content. Rows are never
+    modified: stored content refers to its dictionary by checksum.
+    """
+    checksum = models.BigIntegerField(unique=True)
+    data = models.BinaryField()
+    sample_size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Dictionary {self.checksum:#010x} ({len(self.data)} bytes)"
+
+
+class AgreementTemplate(models.Model):
+    """
+    Shared text of agreements of one type, with `{{ name }}` placeholders
+    filled from each agreement's variables. Templates are never edited:
+    saving a changed body creates the next version.
+    """
+    agreementType = models.CharField(max_length=300, db_index=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    body = models.TextField()
+    variables = models.JSONField(default=list, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agreementType', 'version'], name='template_type_version_uniq'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            self.pk = None
+            self._state.adding = True
+        self.variables = template_variables(self.body)
+        latest = AgreementTemplate.objects.filter(agreementType=self.agreementType).aggregate(
+            latest=models.Max('version')
+        )['latest']
+        self.version = (latest or 0) + 1
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.agreementType} v{self.version}"
+
+
+class LegalAgreementQuerySet(models.QuerySet):
+    def with_content(self):
+        return self.defer(None)
+
+
+class LegalAgreementManager(models.Manager.from_queryset(LegalAgreementQuerySet)):
+    """
+    Leaves the (compressed) content out of fetches unless asked for with
+    `with_content()`; accessing it on an instance loads it on demand.
+    """
+    def get_queryset(self):
+        return super().get_queryset().defer('content')
+
+
 class LegalAgreement(models.Model):
-    content = models.TextField()
+    FILE_FIELDS = ('first_party_valid_id', 'second_party_valid_id', 'first_party_signature', 'second_party_signature')
+    IMAGE_FIELDS = ('first_party_valid_id', 'second_party_valid_id')
+
+    class SigningStatus(models.TextChoices):
+        PENDING = 'pending', 'Awaiting second-party signature'
+        SIGNED = 'signed', 'Signed by the second party'
+
+    # Empty for agreements rendered from a template and its variables
+    content = CompressedTextField(blank=True)
+    template = models.ForeignKey(
+        AgreementTemplate, null=True, blank=True, on_delete=models.PROTECT, related_name='agreements'
+    )
+    variables = models.JSONField(null=True, blank=True)
     email = models.EmailField(null=True)
     access_token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     agreement_id = models.IntegerField(null=True)
@@ -10,25 +157,263 @@ class LegalAgreement(models.Model):
 
     # First party details
     first_party_address = models.CharField(max_length=100)
-    first_party_valid_id = models.ImageField(upload_to="valid_ids/", null=True, blank=True)  # Changed to ImageField
+    first_party_valid_id = models.ImageField(upload_to=UniqueUploadTo("valid_ids/"), storage=blob_storage, null=True, blank=True)  # Changed to ImageField
     first_party_country = models.CharField(max_length=300, null=True)
     first_party_id_type = models.CharField(max_length=300, null=True)
     first_party_fullname = models.CharField(max_length=1000, null=True)
     first_party_signature = models.FileField(
-        upload_to="signatures/", null=True, blank=True
+        upload_to=UniqueUploadTo("signatures/"), storage=blob_storage, null=True, blank=True
     )
 
     # Second party details
     second_party_address = models.CharField(max_length=100)
-    second_party_valid_id = models.ImageField(upload_to="valid_ids/", null=True, blank=True)  # Changed to ImageField
+    second_party_valid_id = models.ImageField(upload_to=UniqueUploadTo("valid_ids/"), storage=blob_storage, null=True, blank=True)  # Changed to ImageField
     second_party_country = models.CharField(max_length=300, null=True)
     second_party_id_type = models.CharField(max_length=300, null=True)
     second_party_fullname = models.CharField(max_length=1000, null=True)
     second_party_signature = models.FileField(
-        upload_to="signatures/", null=True, blank=True
+        upload_to=UniqueUploadTo("signatures/"), storage=blob_storage, null=True, blank=True
     )
 
-    created_at = models.DateTimeField(auto_now_add=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Lowercased copies of the party addresses, indexed for by_party lookups
+    first_party_address_normalized = models.CharField(max_length=100, db_index=True, editable=False, default='')
+    second_party_address_normalized = models.CharField(max_length=100, db_index=True, editable=False, default='')
+
+    # Derived from second_party_signature on save
+    signing_status = models.CharField(
+        max_length=10, choices=SigningStatus.choices, default=SigningStatus.PENDING, editable=False
+    )
+
+    objects = LegalAgreementManager()
+
+    class Meta:
+        indexes = [
+            # Unsigned agreements are the small, hot part of the table; these
+            # serve by_party?status=pending for either role, newest first
+            models.Index(
+                fields=['first_party_address_normalized', '-created_at', '-id'],
+                condition=Q(signing_status='pending'), name='agreement_first_pending_idx',
+            ),
+            models.Index(
+                fields=['second_party_address_normalized', '-created_at', '-id'],
+                condition=Q(signing_status='pending'), name='agreement_second_pending_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.first_party_address_normalized = normalize_address(self.first_party_address)
+        self.second_party_address_normalized = normalize_address(self.second_party_address)
+        if 'second_party_signature' in self.__dict__:
+            self.signing_status = self.signing_status_for(self.second_party_signature)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {
+                'first_party_address_normalized',
+                'second_party_address_normalized',
+            }
+            if 'second_party_signature' in update_fields:
+                kwargs['update_fields'].add('signing_status')
+        written = set(self.__dict__ if update_fields is None else update_fields)
+        self.process_new_images()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.update_blob_references()
+            if written & indexed_fields(self._state.db):
+                index_content([(self.pk, self.render_content())], using=self._state.db)
+
+    @classmethod
+    def signing_status_for(cls, second_party_signature):
+        return cls.SigningStatus.SIGNED if second_party_signature else cls.SigningStatus.PENDING
+
+    @classmethod
+    def claim_signature(cls, agreement_id, name):
+        """
+        Attach the stored file `name` as the second party's signature unless
+        the agreement is already signed. Returns whether it was attached.
+
+        The claim is a single UPDATE conditioned on the pending status, so of
+        concurrent signers exactly one wins whatever the database's locking
+        (SQLite ignores SELECT ... FOR UPDATE). A loser's file is deleted
+        unless it is referenced elsewhere.
+        """
+        with transaction.atomic():
+            claimed = cls.objects.filter(id=agreement_id, signing_status=cls.SigningStatus.PENDING).update(
+                second_party_signature=name, signing_status=cls.SigningStatus.SIGNED,
+            )
+            if claimed:
+                Blob.acquire(name)
+                invalidate_agreement(agreement_id)
+                return True
+            # The same bytes may be what the winner attached
+            signed = cls.objects.filter(id=agreement_id).values_list('second_party_signature', flat=True).first()
+            digest = blob_digest(name)
+            if digest and name != signed:
+                transaction.on_commit(partial(Blob.delete_orphan, digest, name))
+            return False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_files = instance.loaded_file_names()
+        return instance
+
+    def loaded_file_names(self):
+        """
+        Names of the attached files, skipping deferred file fields.
+        """
+        names = {}
+        for field in self.FILE_FIELDS:
+            if field in self.__dict__:
+                value = self.__dict__[field]
+                names[field] = getattr(value, 'name', value) or None
+        return names
+
+    def process_new_images(self):
+        """
+        Downscale, strip and re-encode valid-ID images that are about to be
+        written for the first time.
+        """
+        for field in self.IMAGE_FIELDS:
+            if field not in self.__dict__:
+                continue
+            file = getattr(self, field)
+            if file and not file._committed:
+                try:
+                    processed = normalize_image(file)
+                except ValidationError as error:
+                    raise ValidationError({field: error.detail})
+                if processed is not None:
+                    setattr(self, field, processed)
+
+    def update_blob_references(self):
+        stored = getattr(self, '_stored_files', {})
+        current = self.loaded_file_names()
+        for field, name in current.items():
+            previous = stored.get(field)
+            if name == previous:
+                continue
+            if name:
+                Blob.acquire(name)
+                if field in self.IMAGE_FIELDS:
+                    # Thumbnails are rendered by the worker pool once committed,
+                    # or on first request if that job is lost
+                    transaction.on_commit(partial(schedule_thumbnails, name))
+            if previous:
+                Blob.release(previous)
+        self._stored_files = {**stored, **current}
+
+    def render_content(self):
+        if self.template_id is None:
+            return self.content
+        return render_template(self.template_id, self.variables)
+
+    def __str__(self):
+        return f"Agreement by {self.render_content()} with {self.second_party_address}"
+
+
+
+@receiver(post_delete, sender=LegalAgreement)
+def release_agreement_blobs(sender, instance, **kwargs):
+    for name in instance.loaded_file_names().values():
+        if name:
+            Blob.release(name)
+
+
+@receiver(post_save, sender=ContentDictionary)
+def activate_content_dictionary(sender, instance, created, **kwargs):
+    if created:
+        clear_dictionary_cache()
+
+
+@receiver(post_delete, sender=AgreementTemplate)
+def forget_deleted_template(sender, instance, **kwargs):
+    clear_template_cache()
+
+
+@receiver(post_save, sender=LegalAgreement)
+def invalidate_saved_agreement(sender, instance, **kwargs):
+    invalidate_agreement(instance.pk)
+
+
+@receiver(post_save, sender=LegalAgreement)
+def remember_created_token(sender, instance, created, **kwargs):
+    if created:
+        remember_tokens([instance.access_token])
+
+
+@receiver(post_delete, sender=LegalAgreement)
+def invalidate_deleted_agreement(sender, instance, **kwargs):
+    invalidate_agreement(instance.pk)
+    forget_token(instance.access_token)
+
+
+class EmailOutbox(models.Model):
+    """
+    Outgoing email written in the same transaction as the change that
+    triggers it and delivered later by the `send_outbox` command.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    agreement = models.ForeignKey(LegalAgreement, on_delete=models.SET_NULL, null=True, blank=True, related_name='emails')
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=300)
+    body = models.TextField()
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.recipient} ({self.status})"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress (see agreement/uploads.py). The bytes
+    received so far live in a part file until the upload is finalized into
+    the blob store.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes)"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The outcome of a request sent with an Idempotency-Key header, replayed
+    to retries of the same request (see agreement/idempotency.py). A row
+    without a status code is a request still in progress.
+    """
+    key = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=JSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'method', 'path'], name='idempotency_key_uniq'),
+        ]
 
     def __str__(self):
-        return f"Agreement by {self.content} with {self.second_party_address}"
+        return f"{self.method} {self.path} [{self.key}]"
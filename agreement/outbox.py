@@ -0,0 +1,119 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .instrumentation import timed
+from .models import EmailOutbox
+
+ACCESS_TOKEN_SUBJECT = 'Your Legal Agreement Access Token'
+
+
+def access_token_email(agreement):
+    """
+    Build (unsaved) the outbox entry carrying an agreement's access token.
+    """
+    return EmailOutbox(
+        agreement=agreement,
+        recipient=agreement.email,
+        subject=ACCESS_TOKEN_SUBJECT,
+        body=f'Your access token for the legal agreement is: {agreement.access_token}',
+    )
+
+
+def enqueue_access_token_email(agreement):
+    email = access_token_email(agreement)
+    email.save()
+    return email
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff between delivery attempts, capped at an hour.
+    """
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), 3600))
+
+
+def record_failure(email, exc):
+    email.last_error = str(exc)
+    if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        email.status = EmailOutbox.Status.FAILED
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+
+def claim_due_emails(batch_size):
+    """
+    Lease up to `batch_size` due emails in a short transaction: each one
+    counts an attempt and is put off for OUTBOX_LEASE_SECONDS, so other
+    workers skip it while it is being sent, and it comes due again if this
+    worker dies before recording the result.
+    """
+    with transaction.atomic():
+        emails = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.Status.PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        lease = timezone.now() + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        EmailOutbox.objects.filter(pk__in=[email.pk for email in emails]).update(
+            attempts=F('attempts') + 1, next_attempt_at=lease,
+        )
+    for email in emails:
+        email.attempts += 1
+        email.next_attempt_at = lease
+    return emails
+
+
+def record_result(email):
+    email.save(update_fields=['status', 'next_attempt_at', 'last_error', 'sent_at'])
+
+
+def drain_outbox(batch_size=None, connection=None):
+    """
+    Deliver one batch of due emails over a single mail connection. No
+    transaction is held while talking to the mail server; each result is
+    written on its own. Returns (sent, failed) counts for the batch.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    sent = failed = 0
+
+    emails = claim_due_emails(batch_size)
+    if not emails:
+        return sent, failed
+
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        # Server unreachable: every claimed email used up an attempt
+        for email in emails:
+            record_failure(email, exc)
+            record_result(email)
+        return sent, len(emails)
+
+    with connection:
+        for email in emails:
+            message = EmailMessage(
+                email.subject,
+                email.body,
+                settings.DEFAULT_FROM_EMAIL,
+                [email.recipient],
+                connection=connection,
+            )
+            try:
+                with timed('mail'):
+                    message.send(fail_silently=False)
+            except Exception as exc:
+                record_failure(email, exc)
+                failed += 1
+            else:
+                email.status = EmailOutbox.Status.SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                sent += 1
+            record_result(email)
+    return sent, failed
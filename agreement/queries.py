@@ -0,0 +1,102 @@
+from django.db.models import Case, F, Q, UUIDField, Value, When
+from rest_framework.exceptions import ParseError
+
+from .models import LegalAgreement, normalize_address
+from .routers import primary_reads, replica_alias
+from .serializers import LegalAgreementSerializer
+from .tokenfilter import amight_exist, might_exist
+
+
+ROLES = ('first', 'second')
+
+
+def party_agreements(address, fields=None, status=None, role=None):
+    """
+    Agreements where `address` is either party, or only the given `role`,
+    optionally limited to one signing `status`. Each side of the OR is
+    served by the index on its normalized column (the partial pending
+    indexes for status=pending); the access token is exposed only to the
+    first party, decided in SQL so the whole listing is served by a single
+    query.
+    """
+    address = normalize_address(address)
+    sides = {
+        'first': Q(first_party_address_normalized=address),
+        'second': Q(second_party_address_normalized=address),
+    }
+    party = sides[role] if role else sides['first'] | sides['second']
+    agreements = LegalAgreement.objects.with_content().filter(party)
+    if status:
+        agreements = agreements.filter(signing_status=status)
+    agreements = agreements.annotate(
+        party_access_token=Case(
+            When(first_party_address_normalized=address, then=F('access_token')),
+            default=Value(None),
+            output_field=UUIDField(),
+        )
+    )
+    if fields is not None:
+        # Deselect unrequested columns in SQL; id and created_at drive the cursor
+        agreements = agreements.only(*(set(fields) | {'id', 'created_at'}))
+    return agreements
+
+
+def party_filters(query_params):
+    """
+    The `status` and `role` query parameters of by_party, validated.
+    """
+    status = query_params.get('status') or None
+    role = query_params.get('role') or None
+    if status and status not in LegalAgreement.SigningStatus.values:
+        raise ParseError(f"Status must be one of: {', '.join(LegalAgreement.SigningStatus.values)}.")
+    if role and role not in ROLES:
+        raise ParseError(f"Role must be one of: {', '.join(ROLES)}.")
+    return {'status': status, 'role': role}
+
+
+def projected_fields(query_params):
+    """
+    Resolve the `fields` / `exclude` query parameters into the list of
+    serializer fields to render, or None when no projection was asked for.
+    """
+    requested = query_params.get('fields')
+    excluded = query_params.get('exclude')
+    if not requested and not excluded:
+        return None
+
+    available = list(LegalAgreementSerializer().fields)
+    fields = [name.strip() for name in requested.split(',') if name.strip()] if requested else available
+    excluded = {name.strip() for name in excluded.split(',') if name.strip()} if excluded else set()
+
+    unknown = (set(fields) | excluded) - set(available)
+    if unknown:
+        raise ParseError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    return [name for name in fields if name not in excluded]
+
+
+def token_agreement_id(access_token):
+    """
+    Id of the agreement holding `access_token`, or None. A miss on the
+    replica is retried on the primary, since a freshly created agreement
+    may not have replicated yet. Tokens the filter has never seen are
+    rejected without a query.
+    """
+    if not might_exist(access_token):
+        return None
+    lookup = LegalAgreement.objects.filter(access_token=access_token).values_list('id', flat=True)
+    agreement_id = lookup.first()
+    if agreement_id is None and replica_alias():
+        with primary_reads():
+            agreement_id = lookup.first()
+    return agreement_id
+
+
+async def atoken_agreement_id(access_token):
+    if not await amight_exist(access_token):
+        return None
+    lookup = LegalAgreement.objects.filter(access_token=access_token).values_list('id', flat=True)
+    agreement_id = await lookup.afirst()
+    if agreement_id is None and replica_alias():
+        with primary_reads():
+            agreement_id = await lookup.afirst()
+    return agreement_id
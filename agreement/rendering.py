@@ -0,0 +1,100 @@
+"""
+Agreement templates: `{{ name }}` placeholders in a template body are
+filled from an agreement's variable bindings when its content is read.
+
+A body is compiled once into a str.format string, so rendering is a single
+C-level `format_map` call. Compiled templates are cached per process with
+LRU eviction; template rows are immutable (edits create a new version), so
+cached entries never go stale.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+PLACEHOLDER_RE = re.compile(r'{{\s*([A-Za-z_]\w*)\s*}}')
+
+_lock = threading.Lock()
+_compiled = OrderedDict()
+
+
+class Bindings(dict):
+    # A binding removed after creation renders empty instead of failing the read
+    def __missing__(self, key):
+        return ''
+
+
+def template_variables(body):
+    """
+    Placeholder names in `body`, in order of first use.
+    """
+    return list(dict.fromkeys(PLACEHOLDER_RE.findall(body)))
+
+
+def compile_template(body):
+    parts, position = [], 0
+    for match in PLACEHOLDER_RE.finditer(body):
+        parts.append(body[position:match.start()].replace('{', '{{').replace('}', '}}'))
+        parts.append(f'{{{match.group(1)}}}')
+        position = match.end()
+    parts.append(body[position:].replace('{', '{{').replace('}', '}}'))
+    return ''.join(parts)
+
+
+def remember(template_id, body):
+    compiled = compile_template(body)
+    with _lock:
+        _compiled[template_id] = compiled
+        _compiled.move_to_end(template_id)
+        while len(_compiled) > settings.AGREEMENT_TEMPLATE_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
+
+
+def cached(template_id):
+    with _lock:
+        compiled = _compiled.get(template_id)
+        if compiled is not None:
+            _compiled.move_to_end(template_id)
+        return compiled
+
+
+def missing(template_ids):
+    with _lock:
+        return {pk for pk in template_ids if pk is not None and pk not in _compiled}
+
+
+def load_templates(template_ids):
+    """
+    Compile every template in `template_ids` that isn't cached, in one
+    query. Returns the newly compiled templates by id.
+    """
+    from .models import AgreementTemplate
+
+    ids = missing(template_ids)
+    if not ids:
+        return {}
+    return {
+        pk: remember(pk, body)
+        for pk, body in AgreementTemplate.objects.filter(id__in=ids).values_list('id', 'body')
+    }
+
+
+async def aload_templates(template_ids):
+    from .models import AgreementTemplate
+
+    ids = missing(template_ids)
+    if ids:
+        async for pk, body in AgreementTemplate.objects.filter(id__in=ids).values_list('id', 'body'):
+            remember(pk, body)
+
+
+def render_template(template_id, variables):
+    compiled = cached(template_id) or load_templates([template_id]).get(template_id, '')
+    return compiled.format_map(Bindings(variables or {}))
+
+
+def clear_template_cache():
+    with _lock:
+        _compiled.clear()
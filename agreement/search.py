@@ -0,0 +1,102 @@
+"""
+Full-text search over agreement content, type and party names.
+
+The index lives in the database. Content is stored compressed, which the
+database can't read, so `index_content` feeds its text in from the
+application whenever it is written:
+
+- PostgreSQL: a weighted `search_vector` tsvector column with a GIN index,
+  combined by trigger from the text columns and `content_vector` (see
+  migrations 0008 and 0009).
+- SQLite: a contentless FTS5 table ranked with bm25 (see migration 0015).
+  It holds no copy of the text, and its rows can only be written whole, so
+  a write to any indexed field re-indexes the row; a trigger drops deleted
+  rows. Matches are looked up in the agreement table by rowid.
+
+The tsvector columns are deliberately not model fields, so ordinary reads
+never fetch them.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+TABLE = 'agreement_legalagreement'
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'agreement_legalagreement_fts'
+TEXT_COLUMNS = '"agreementType", first_party_fullname, second_party_fullname'
+TEXT_FIELDS = {'agreementType', 'first_party_fullname', 'second_party_fullname'}
+# bm25 weights for the FTS5 columns: content, agreementType, first and second party fullname
+FTS_WEIGHTS = (1.0, 4.0, 2.0, 2.0)
+
+
+def fts5_query(text):
+    """
+    Quote every word so user input can never be read as FTS5 query syntax.
+    """
+    return ' '.join(f'"{term}"' for term in re.findall(r'\w+', text))
+
+
+def indexed_fields(using='default'):
+    """
+    Fields whose writes have to be passed to `index_content`.
+    """
+    if connections[using].vendor == 'sqlite':
+        return {'content', *TEXT_FIELDS}
+    return {'content'}
+
+
+def index_content(rows, using='default'):
+    """
+    Index the plain text of freshly written content; `rows` holds
+    (agreement id, text) pairs.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        sql = f"UPDATE {TABLE} SET content_vector = to_tsvector('{SEARCH_CONFIG}', %s) WHERE id = %s"
+    elif connection.vendor == 'sqlite':
+        sql = (
+            f"INSERT OR REPLACE INTO {FTS_TABLE}(rowid, content, {TEXT_COLUMNS}) "
+            f"SELECT id, %s, {TEXT_COLUMNS} FROM {TABLE} WHERE id = %s"
+        )
+    else:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(text, pk) for pk, text in rows])
+
+
+def search_agreements(queryset, text):
+    """
+    Filter `queryset` to agreements matching `text`, annotated with
+    `search_rank` and ordered best match first.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        queryset = postgres_search(queryset, text)
+    else:
+        queryset = sqlite_search(queryset, text)
+    return queryset.order_by('-search_rank', '-created_at', '-id')
+
+
+def postgres_search(queryset, text):
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    vector = RawSQL(f'{TABLE}.search_vector', [], output_field=SearchVectorField())
+    return queryset.alias(search_vector=vector).filter(search_vector=query).annotate(
+        search_rank=SearchRank(vector, query)
+    )
+
+
+def sqlite_search(queryset, text):
+    match = fts5_query(text)
+    if not match:
+        return queryset.none()
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    # FTS5 resolves MATCH plus a rowid constraint with a doclist seek, so
+    # ranking each candidate row costs an index probe rather than a scan
+    rank = RawSQL(
+        f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = {TABLE}.id',
+        (match,),
+    )
+    matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+    return queryset.filter(id__in=matches).annotate(search_rank=rank)
@@ -1,25 +1,195 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import LegalAgreement
+from .images import thumbnail_names
+from .instrumentation import timed
+from .media import file_url, url_expiry
+from .models import AgreementTemplate, Blob, LegalAgreement, UploadSession
+from .rendering import load_templates, render_template
+from .uploads import blob_token
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
 
 class LegalAgreementSerializer(serializers.ModelSerializer):
     class Meta:
         model = LegalAgreement
-        fields = '__all__'
+        list_serializer_class = TimedListSerializer
+        exclude = ['first_party_address_normalized', 'second_party_address_normalized']
         read_only_fields = ['access_token', 'created_at']
 
+    def __init__(self, *args, **kwargs):
+        # Optional projection: only render the given field names
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+    def validate(self, attrs):
+        template = attrs.get('template', getattr(self.instance, 'template', None))
+        if template is not None:
+            variables = attrs.get('variables', getattr(self.instance, 'variables', None))
+            if not isinstance(variables, dict):
+                raise serializers.ValidationError({'variables': "An object of template variable values is required."})
+            unfilled = [name for name in template.variables if name not in variables]
+            if unfilled:
+                raise serializers.ValidationError({'variables': f"Missing values for: {', '.join(unfilled)}."})
+            # The text is rendered from the template on read; writing the
+            # (empty) content also re-indexes the rendered text for search
+            if self.instance is None or 'template' in attrs or 'variables' in attrs:
+                attrs['content'] = ''
+        elif self.instance is None and not attrs.get('content'):
+            raise serializers.ValidationError({'content': "Either content or a template is required."})
+        return attrs
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['created_at'] = instance.created_at
+        if 'content' in self.fields and instance.template_id is not None:
+            representation['content'] = instance.render_content()
+        if 'created_at' in self.fields:
+            representation['created_at'] = instance.created_at
 
-        # Include full file URLs in the representation (if using Django's MEDIA_URL)
-        request = self.context.get('request')
-        if instance.first_party_valid_id:
-            representation['first_party_valid_id'] = request.build_absolute_uri(instance.first_party_valid_id.url) if request else instance.first_party_valid_id.url
-        if instance.second_party_valid_id:
-            representation['second_party_valid_id'] = request.build_absolute_uri(instance.second_party_valid_id.url) if request else instance.second_party_valid_id.url
-        if instance.first_party_signature:
-            representation['first_party_signature'] = request.build_absolute_uri(instance.first_party_signature.url) if request else instance.first_party_signature.url
-        if instance.second_party_signature:
-            representation['second_party_signature'] = request.build_absolute_uri(instance.second_party_signature.url) if request else instance.second_party_signature.url
+        # by_party annotates the token it is allowed to expose for the caller
+        if 'access_token' in self.fields and hasattr(instance, 'party_access_token'):
+            token = instance.party_access_token
+            representation['access_token'] = str(token) if token else None
+
+        # Files are linked through the access-checked files/<field>/ endpoint
+        # with signed URLs, and only for callers holding the access token
+        # (the file_links context flag); others get no file fields at all.
+        # Projected-out fields are skipped so deferred columns are never loaded.
+        base, expires = self.absolute_url(reverse('legalagreement-list')), url_expiry()
+        for name in LegalAgreement.FILE_FIELDS:
+            if name not in self.fields:
+                continue
+            if not self.context.get('file_links'):
+                representation.pop(name)
+                continue
+            file_field = getattr(instance, name)
+            if file_field:
+                representation[name] = file_url(base, instance.pk, name, file_field.name, expires)
+                if name in LegalAgreement.IMAGE_FIELDS:
+                    representation[f'{name}_thumbnails'] = {
+                        variant: file_url(base, instance.pk, name, file_field.name, expires, variant)
+                        for variant, target in thumbnail_names(file_field.name).items()
+                        if target
+                    }
 
         return representation
+
+    def absolute_url(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+
+class CompactAgreementSerializer:
+    """
+    Read-only fast path rendering `values()` rows exactly as
+    LegalAgreementSerializer renders instances. The field plan, the
+    absolute URL prefix of file links and their expiry are worked out once
+    per serializer, so each row costs a few dict operations and an HMAC
+    per file instead of a pass over DRF fields and several
+    build_absolute_uri calls.
+    """
+    def __init__(self, fields=None, request=None, file_links=False):
+        # file_links plays the part of LegalAgreementSerializer's context flag
+        self.names = list(LegalAgreementSerializer(fields=fields).fields)
+        if not file_links:
+            self.names = [name for name in self.names if name not in LegalAgreement.FILE_FIELDS]
+        # id and created_at are always fetched so keyset pagination can build
+        # cursors; templated content is rendered from template and variables
+        extra = ['id', 'created_at'] + (['template', 'variables'] if 'content' in self.names else [])
+        self.columns = list(dict.fromkeys(self.names + extra))
+        self.file_names = [name for name in LegalAgreement.FILE_FIELDS if name in self.names]
+        self.image_names = [name for name in LegalAgreement.IMAGE_FIELDS if name in self.names]
+        self.file_base = self.absolute_url(request, reverse('legalagreement-list'))
+        self.expires = url_expiry()
+
+    @staticmethod
+    def absolute_url(request, url):
+        return request.build_absolute_uri(url) if request else url
+
+    def rows(self, queryset):
+        annotations = ['party_access_token'] if 'party_access_token' in queryset.query.annotations else []
+        return queryset.values(*self.columns, *annotations)
+
+    def template_ids(self, rows):
+        if 'content' not in self.names:
+            return set()
+        return {row['template'] for row in rows if row['template'] is not None}
+
+    def serialize(self, rows):
+        rows = list(rows)
+        load_templates(self.template_ids(rows))
+        with timed('serialize'):
+            return [self.to_representation(row) for row in rows]
+
+    def to_representation(self, row):
+        data = {name: row[name] for name in self.names}
+
+        if 'content' in data and row['template'] is not None:
+            data['content'] = render_template(row['template'], row['variables'])
+
+        if 'access_token' in data:
+            token = row.get('party_access_token', data['access_token'])
+            data['access_token'] = str(token) if token else None
+
+        for name in self.file_names:
+            value = data[name]
+            data[name] = file_url(self.file_base, row['id'], name, value, self.expires) if value else None
+
+        for name in self.image_names:
+            value = row[name]
+            if value:
+                data[f'{name}_thumbnails'] = {
+                    variant: file_url(self.file_base, row['id'], name, value, self.expires, variant)
+                    for variant, target in thumbnail_names(value).items()
+                    if target
+                }
+        return data
+
+
+class BulkLegalAgreementSerializer(LegalAgreementSerializer):
+    """
+    Input serializer for bulk creation: file fields carry the tokens of
+    blobs uploaded beforehand instead of multipart files.
+    """
+    first_party_valid_id = serializers.CharField(required=False, allow_null=True)
+    second_party_valid_id = serializers.CharField(required=False, allow_null=True)
+    first_party_signature = serializers.CharField(required=False, allow_null=True)
+    second_party_signature = serializers.CharField(required=False, allow_null=True)
+
+
+class BlobSerializer(serializers.ModelSerializer):
+    token = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Blob
+        fields = ['token', 'sha256', 'size']
+
+    def get_token(self, blob):
+        return blob_token(blob)
+
+
+class AgreementTemplateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AgreementTemplate
+        fields = ['id', 'agreementType', 'version', 'body', 'variables', 'created_at']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'offset', 'sha256', 'created_at']
+        read_only_fields = ['offset']
+        extra_kwargs = {'sha256': {'write_only': True}}
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+from .instrumentation import timed
+
+BLOB_PREFIX = 'blobs/'
+# Where blobs are written before being linked under their content name
+INCOMING_PREFIX = 'incoming/'
+
+
+@deconstructible
+class UniqueUploadTo:
+    """
+    `upload_to` callable that gives every upload a UUID name under `prefix`,
+    so files are written once under their final name and never renamed.
+    BlobStorage only keeps the extension of this name.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def __call__(self, instance, filename):
+        extension = os.path.splitext(filename)[1].lower()
+        return f"{self.prefix}{uuid.uuid4()}{extension}"
+
+    def __eq__(self, other):
+        return isinstance(other, UniqueUploadTo) and self.prefix == other.prefix
+
+
+def blob_name(digest, extension):
+    return f"{BLOB_PREFIX}{digest[:2]}/{digest}{extension}"
+
+
+def blob_digest(name):
+    """
+    SHA-256 digest encoded in a blob name, or None for files stored
+    outside the blob store (e.g. uploads that predate it).
+    """
+    if not name or not name.startswith(BLOB_PREFIX):
+        return None
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    """
+    Content-addressed storage: files are stored under the SHA-256 of their
+    bytes, and saving content that is already stored skips the write and
+    returns the existing name. Reference counts live in the Blob table.
+    """
+    def save(self, name, content, max_length=None):
+        with timed('storage'):
+            return self.save_blob(name, content, max_length)
+
+    def _open(self, name, mode='rb'):
+        with timed('storage'):
+            return super()._open(name, mode)
+
+    def get_available_name(self, name, max_length=None):
+        # A blob name is its content: an existing file under it already
+        # holds these bytes, so it is reused rather than renamed
+        if blob_digest(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not blob_digest(name):
+            return super()._save(name, content)
+        # Written in full under a temporary name, then linked into place.
+        # The link fails if a concurrent save of the same bytes got there
+        # first, and readers never see a partly written blob.
+        temporary = self.path(super()._save(f'{INCOMING_PREFIX}{uuid.uuid4().hex}', content))
+        target = self.path(name)
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.link(temporary, target)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+        return name
+
+    def save_blob(self, name, content, max_length=None):
+        from .models import Blob
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        digest = sha256.hexdigest()
+
+        existing = Blob.objects.filter(sha256=digest).values_list('name', flat=True).first()
+        if existing and self.exists(existing):
+            return existing
+
+        name = blob_name(digest, os.path.splitext(name)[1].lower())
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def adopt(self, path, name, digest):
+        """
+        Move the local file at `path`, whose SHA-256 is `digest`, into the
+        store. A rename when both are on one filesystem, so the bytes are
+        never copied. Returns the blob name.
+        """
+        from .models import Blob
+
+        existing = Blob.objects.filter(sha256=digest).values_list('name', flat=True).first()
+        if existing and self.exists(existing):
+            os.remove(path)
+            return existing
+
+        name = blob_name(digest, os.path.splitext(name)[1].lower())
+        with timed('storage'):
+            if self.exists(name):
+                os.remove(path)
+                return name
+            target = self.path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            file_move_safe(path, target)
+            if self.file_permissions_mode is not None:
+                os.chmod(target, self.file_permissions_mode)
+        return name
+
+
+blob_storage = BlobStorage()
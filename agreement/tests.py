@@ -1,3 +1,1347 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from PIL import Image
+
+from django.conf import settings
+from django.core import mail
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+
+from custosBackend.docs import clear_schema_cache
+
+from . import async_views
+from . import cache as agreement_cache
+from . import tokenfilter
+from .compression import (
+    active_dictionary, clear_dictionary_cache, compress, decompress, dictionary_checksum, train_dictionary,
+)
+from .export import AgreementExport
+from .images import generate_thumbnails
+from .instrumentation import registry
+from .middleware import PerformanceMiddleware
+from .idempotency import purge_expired_keys
+from .models import (
+    AgreementTemplate, Blob, ContentDictionary, EmailOutbox, IdempotencyKey, LegalAgreement, UploadSession,
+)
+from .outbox import drain_outbox
+from .queries import party_agreements
+from .rendering import clear_template_cache, compile_template
+from .routers import ReplicaRouter, replica_reads
+from .search import search_agreements
+from .serializers import CompactAgreementSerializer, LegalAgreementSerializer
+from .storage import BlobStorage, blob_storage
+from .tokenfilter import BloomFilter, bump_generation, clear_token_filter
+from .uploads import part_path, purge_orphan_blobs, purge_stale_sessions
+from .views import LegalAgreementViewSet
+
+# Keep the per-request performance log out of the test output
+logging.getLogger('agreement.performance').setLevel(logging.WARNING)
+
+
+def make_agreement(**kwargs):
+    fields = {
+        'content': 'Agreement content',
+        'first_party_address': '0xAAA',
+        'second_party_address': '0xBBB',
+    }
+    fields.update(kwargs)
+    return LegalAgreement.objects.create(**fields)
+
+
+class AgreementTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        # Look the active compression dictionary up now so query counts don't depend on test order
+        clear_dictionary_cache()
+        active_dictionary()
+        clear_template_cache()
+        clear_token_filter()
+
+
+class ByPartyTests(AgreementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('legalagreement-by-party')
+
+    def test_access_token_only_exposed_to_first_party(self):
+        as_first = make_agreement(first_party_address='0xAbC', second_party_address='0x111')
+        as_second = make_agreement(first_party_address='0x222', second_party_address='0xabc')
+        make_agreement(first_party_address='0x333', second_party_address='0x444')
+
+        response = self.client.get(self.url, {'address': '0xabc'})
+
+        self.assertEqual(response.status_code, 200)
+        tokens = {item['id']: item['access_token'] for item in response.json()}
+        self.assertEqual(tokens, {
+            as_first.id: str(as_first.access_token),
+            as_second.id: None,
+        })
+
+    def test_query_count_is_independent_of_result_size(self):
+        for _ in range(25):
+            make_agreement()
+            make_agreement(first_party_address='0xCCC', second_party_address='0xAAA')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'address': '0xaaa'})
+
+        self.assertEqual(len(response.json()), 50)
+
+    def test_compact_serializer_matches_model_serializer(self):
+        agreement = make_agreement(email='a@example.com', agreementType='Lease')
+        LegalAgreement.objects.filter(id=agreement.id).update(
+            first_party_valid_id=f"blobs/ab/{'ab' * 32}.png", second_party_signature='signatures/legacy.png',
+        )
+        request = RequestFactory().get('/')
+        for fields, file_links in itertools.product((None, ['id', 'first_party_valid_id', 'access_token']), (False, True)):
+            queryset = party_agreements('0xbbb', fields)
+            context = {'request': request, 'file_links': file_links}
+            expected = LegalAgreementSerializer(queryset, many=True, fields=fields, context=context).data
+            serializer = CompactAgreementSerializer(fields, request, file_links)
+
+            self.assertEqual(json.dumps(serializer.serialize(serializer.rows(queryset)), cls=JSONEncoder), json.dumps(expected, cls=JSONEncoder))
+
+    def test_address_is_required(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+
+    def test_keyset_pagination_walks_every_row_once(self):
+        created = [make_agreement() for _ in range(7)]
+
+        seen = []
+        response = self.client.get(self.url, {'address': '0xaaa', 'limit': 3})
+        while True:
+            body = response.json()
+            seen.extend(item['id'] for item in body['results'])
+            if not body['next']:
+                break
+            response = self.client.get(body['next'])
+
+        self.assertEqual(seen, sorted((a.id for a in created), reverse=True))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'address': '0xaaa', 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_field_projection_defers_unrequested_columns(self):
+        make_agreement()
+
+        with self.assertNumQueries(1) as ctx:
+            response = self.client.get(self.url, {'address': '0xaaa', 'exclude': 'content'})
+
+        self.assertNotIn('content', response.json()[0])
+        self.assertNotIn('"content"', ctx.captured_queries[0]['sql'])
+
+        response = self.client.get(self.url, {'address': '0xaaa', 'fields': 'id,agreementType'})
+        self.assertEqual(set(response.json()[0]), {'id', 'agreementType'})
+
+    def test_unknown_projection_field_is_rejected(self):
+        response = self.client.get(self.url, {'address': '0xaaa', 'fields': 'id,nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class SearchTests(AgreementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('legalagreement-search')
+
+    def test_ranked_matches_scoped_to_address(self):
+        typed = make_agreement(agreementType='Lease agreement', content='Terms of occupancy')
+        mentioned = make_agreement(content='This lease may be renewed once')
+        make_agreement(content='Sale of goods')
+        make_agreement(first_party_address='0xCCC', second_party_address='0xDDD', content='Lease')
+
+        response = self.client.get(self.url, {'address': '0xaaa', 'q': 'lease'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()], [typed.id, mentioned.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        agreement = make_agreement(content='Loan of equipment')
+        agreement.first_party_fullname = 'Ada Lovelace'
+        agreement.save(update_fields=['first_party_fullname'])
+
+        response = self.client.get(self.url, {'address': '0xaaa', 'q': 'lovelace', 'fields': 'id'})
+        self.assertEqual(response.json(), [{'id': agreement.id}])
+
+        agreement.delete()
+        response = self.client.get(self.url, {'address': '0xaaa', 'q': 'lovelace'})
+        self.assertEqual(response.json(), [])
+
+    def test_query_syntax_is_treated_as_words(self):
+        agreement = make_agreement(content='Services "AND" NEAR(support)')
+
+        response = self.client.get(self.url, {'address': '0xaaa', 'q': 'NEAR(support" *'})
+
+        self.assertEqual([item['id'] for item in response.json()], [agreement.id])
+
+    def test_address_and_query_are_required(self):
+        response = self.client.get(self.url, {'address': '0xaaa'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class ContentCompressionTests(AgreementTestCase):
+    TEMPLATE = (
+        "This Agreement is entered into by and between the parties named below.\n"
+        "Each party represents that it has full authority to enter into this Agreement.\n"
+        "This Agreement shall be governed by the laws of the jurisdiction of the first party.\n"
+    )
+
+    def test_content_is_stored_compressed_and_deferred(self):
+        agreement = make_agreement(content=self.TEMPLATE * 20)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content FROM agreement_legalagreement WHERE id = %s', [agreement.id])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertLess(len(stored), len(self.TEMPLATE))
+
+        fetched = LegalAgreement.objects.get(id=agreement.id)
+        self.assertIn('content', fetched.get_deferred_fields())
+        with self.assertNumQueries(1):
+            self.assertEqual(fetched.content, self.TEMPLATE * 20)
+
+    def test_trained_dictionary_shrinks_short_documents(self):
+        text = self.TEMPLATE + "Signed by party number 99."
+        without_dictionary = compress(text)
+        samples = [self.TEMPLATE + f"Signed by party number {i}." for i in range(50)]
+        data = train_dictionary(samples)
+        dictionary = ContentDictionary.objects.create(checksum=dictionary_checksum(data), data=data, sample_size=len(samples))
+        self.addCleanup(clear_dictionary_cache)
+
+        compressed = compress(text)
+
+        self.assertLess(len(compressed), len(without_dictionary) // 2)
+        clear_dictionary_cache()
+        self.assertEqual(decompress(compressed), text)
+
+        agreement = make_agreement(content=text)
+        self.assertEqual(LegalAgreement.objects.with_content().get(id=agreement.id).content, text)
+        self.assertEqual(dictionary.checksum, active_dictionary()[0])
+
+    def test_content_changes_are_searchable(self):
+        agreement = make_agreement(content='Loan of equipment')
+        agreement = LegalAgreement.objects.get(id=agreement.id)
+        agreement.content = 'Lease of farmland'
+        agreement.save()
+
+        response = self.client.get(reverse('legalagreement-search'), {'address': '0xaaa', 'q': 'farmland'})
+
+        self.assertEqual([item['id'] for item in response.json()], [agreement.id])
+
+
+class AgreementTemplateTests(AgreementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.template = AgreementTemplate.objects.create(
+            agreementType='Loan', body='{{ lender }} lends {{borrower}} the sum of {amount}.',
+        )
+
+    def create(self, **data):
+        return self.client.post(reverse('legalagreement-list'), {
+            'first_party_address': '0xAAA',
+            'second_party_address': '0xBBB',
+            'template': self.template.id,
+            **data,
+        })
+
+    def test_template_is_compiled_once(self):
+        self.assertEqual(self.template.variables, ['lender', 'borrower'])
+        self.assertEqual(compile_template(self.template.body), '{lender} lends {borrower} the sum of {{amount}}.')
+
+    def test_content_is_rendered_from_template_on_read(self):
+        response = self.create(variables=json.dumps({'lender': 'Ada', 'borrower': 'Bob'}))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['agreement']['content'], 'Ada lends Bob the sum of {amount}.')
+        agreement_id = response.json()['agreement']['id']
+        self.assertEqual(LegalAgreement.objects.with_content().get(id=agreement_id).content, '')
+
+        response = self.client.get(reverse('legalagreement-by-party'), {'address': '0xaaa', 'fields': 'id,content'})
+        self.assertEqual(response.json(), [{'id': agreement_id, 'content': 'Ada lends Bob the sum of {amount}.'}])
+
+        response = self.client.get(reverse('legalagreement-search'), {'address': '0xaaa', 'q': 'Bob', 'fields': 'id'})
+        self.assertEqual(response.json(), [{'id': agreement_id}])
+
+    def test_missing_variables_are_rejected(self):
+        response = self.create(variables=json.dumps({'lender': 'Ada'}))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('borrower', response.json()['variables'][0])
+
+    def test_saving_a_template_adds_a_version(self):
+        agreement = make_agreement(template=self.template, variables={'lender': 'Ada', 'borrower': 'Bob'}, content='')
+        self.template.body = '{{ lender }} gives {{ borrower }} a gift.'
+        self.template.save()
+
+        self.assertEqual(self.template.version, 2)
+        self.assertEqual(AgreementTemplate.objects.count(), 2)
+        agreement = LegalAgreement.objects.get(id=agreement.id)
+        self.assertEqual(agreement.render_content(), 'Ada lends Bob the sum of {amount}.')
+
+    def test_only_admins_create_templates(self):
+        url = reverse('agreementtemplate-list')
+        response = self.client.post(url, {'agreementType': 'Loan', 'body': 'x'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get(url, {'agreementType': 'Loan'})
+        self.assertEqual([item['id'] for item in response.json()], [self.template.id])
+
+
+class OutboxTests(AgreementTestCase):
+    def test_create_queues_email_instead_of_sending(self):
+        response = self.client.post(reverse('legalagreement-list'), {
+            'content': 'Agreement content',
+            'email': 'party@example.com',
+            'first_party_address': '0xAAA',
+            'second_party_address': '0xBBB',
+        })
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = EmailOutbox.objects.get()
+        self.assertEqual(queued.recipient, 'party@example.com')
+        self.assertIn(response.json()['access_token'], queued.body)
+
+        self.assertEqual(drain_outbox(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['party@example.com'])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, EmailOutbox.Status.SENT)
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        EmailOutbox.objects.create(recipient='party@example.com', subject='s', body='b')
+
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('smtp down')):
+            self.assertEqual(drain_outbox(), (0, 1))
+
+        queued = EmailOutbox.objects.get()
+        self.assertEqual(queued.status, EmailOutbox.Status.PENDING)
+        self.assertEqual(queued.attempts, 1)
+        self.assertGreater(queued.next_attempt_at, timezone.now())
+        # Not due yet, so the next drain leaves it alone
+        self.assertEqual(drain_outbox(), (0, 0))
+
+    def test_unreachable_server_counts_an_attempt_for_each_claimed_email(self):
+        for recipient in ('a@example.com', 'b@example.com'):
+            EmailOutbox.objects.create(recipient=recipient, subject='s', body='b')
+        connection = mock.Mock()
+        connection.open.side_effect = ConnectionRefusedError('refused')
+
+        self.assertEqual(drain_outbox(connection=connection), (0, 2))
+
+        for queued in EmailOutbox.objects.all():
+            self.assertEqual((queued.status, queued.attempts), (EmailOutbox.Status.PENDING, 1))
+            self.assertIn('refused', queued.last_error)
+            self.assertGreater(queued.next_attempt_at, timezone.now())
+
+
+class OutboxLeaseTests(TransactionTestCase):
+    def test_emails_are_sent_under_a_lease_outside_any_transaction(self):
+        EmailOutbox.objects.create(recipient='party@example.com', subject='s', body='b')
+        during_send = []
+
+        def send(message, fail_silently):
+            # Another worker draining meanwhile finds the email leased
+            during_send.append((connection.in_atomic_block, drain_outbox()))
+            return 1
+
+        with mock.patch('django.core.mail.EmailMessage.send', autospec=True, side_effect=send):
+            self.assertEqual(drain_outbox(), (1, 0))
+
+        self.assertEqual(during_send, [(False, (0, 0))])
+        queued = EmailOutbox.objects.get()
+        self.assertEqual((queued.status, queued.attempts), (EmailOutbox.Status.SENT, 1))
+
+    def test_lease_of_a_worker_that_died_expires(self):
+        EmailOutbox.objects.create(recipient='party@example.com', subject='s', body='b')
+        with mock.patch('agreement.outbox.record_result'):
+            self.assertEqual(drain_outbox(connection=mock.MagicMock()), (1, 0))
+        self.assertEqual(drain_outbox(), (0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_outbox(), (1, 0))
+        self.assertEqual(EmailOutbox.objects.get().attempts, 2)
+
+
+class MediaTestCase(AgreementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class SignAgreementTests(MediaTestCase):
+    def sign(self, agreement, content=b'signature-bytes'):
+        signature = SimpleUploadedFile('My Signature.PNG', content, content_type='image/png')
+        return self.client.post(
+            reverse('legalagreement-sign-agreement', args=[agreement.id]),
+            {'second_party_signature': signature},
+        )
+
+    def test_signature_is_stored_once_under_its_content_hash(self):
+        agreement = make_agreement()
+
+        response = self.sign(agreement)
+
+        self.assertEqual(response.status_code, 200)
+        agreement.refresh_from_db()
+        name = agreement.second_party_signature.name
+        self.assertRegex(name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(os.listdir(os.path.dirname(agreement.second_party_signature.path)), [os.path.basename(name)])
+        with agreement.second_party_signature.open('rb') as stored:
+            self.assertEqual(stored.read(), b'signature-bytes')
+
+    def test_signing_moves_agreement_out_of_pending(self):
+        signed, pending = make_agreement(), make_agreement()
+        make_agreement(first_party_address='0xBBB', second_party_address='0xAAA')
+        self.assertEqual(signed.signing_status, LegalAgreement.SigningStatus.PENDING)
+        self.sign(signed)
+
+        url = reverse('legalagreement-by-party')
+        response = self.client.get(url, {'address': '0xbbb', 'role': 'second', 'status': 'pending', 'fields': 'id'})
+        self.assertEqual(response.json(), [{'id': pending.id}])
+        response = self.client.get(url, {'address': '0xbbb', 'status': 'signed', 'fields': 'id,signing_status'})
+        self.assertEqual(response.json(), [{'id': signed.id, 'signing_status': 'signed'}])
+        self.assertEqual(self.client.get(url, {'address': '0xbbb', 'status': 'done'}).status_code, 400)
+
+    def test_pending_listing_uses_partial_index(self):
+        agreements = party_agreements('0xBBB', status='pending', role='second').order_by('-created_at', '-id')
+        self.assertIn('agreement_second_pending_idx', agreements.explain())
+
+    def test_identical_uploads_share_one_blob_until_last_reference_goes(self):
+        first, second = make_agreement(), make_agreement()
+        self.sign(first)
+        self.sign(second)
+        first.refresh_from_db()
+        second.refresh_from_db()
+
+        self.assertEqual(first.second_party_signature.name, second.second_party_signature.name)
+        path = first.second_party_signature.path
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('legalagreement-detail', args=[first.id]))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('legalagreement-detail', args=[second.id]))
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_concurrent_saves_of_the_same_bytes_share_one_name(self):
+        savers = 4
+        barrier = threading.Barrier(savers)
+        checked = threading.local()
+        names = []
+        real_exists = blob_storage.exists
+
+        def exists(name):
+            # Every saver gets past its check for an existing blob before any writes
+            if not getattr(checked, 'done', False):
+                checked.done = True
+                barrier.wait()
+                return False
+            return real_exists(name)
+
+        def save():
+            try:
+                names.append(blob_storage.save('signature.png', ContentFile(b'same-bytes')))
+            finally:
+                connection.close()
+
+        with mock.patch.object(BlobStorage, 'exists', side_effect=exists):
+            threads = [threading.Thread(target=save) for _ in range(savers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(set(names)), 1)
+        self.assertRegex(names[0], r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(os.listdir(os.path.dirname(blob_storage.path(names[0]))), [os.path.basename(names[0])])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'incoming')), [])
+
+    def test_retry_with_idempotency_key_replays_the_first_response(self):
+        agreement = make_agreement()
+        url = reverse('legalagreement-sign-agreement', args=[agreement.id])
+        signature = SimpleUploadedFile('signature.png', b'first-bytes', content_type='image/png')
+        first = self.client.post(url, {'second_party_signature': signature}, HTTP_IDEMPOTENCY_KEY='sign-1')
+        self.assertEqual(first.status_code, 200)
+
+        retry_file = SimpleUploadedFile('signature.png', b'retried-bytes', content_type='image/png')
+        with self.assertNumQueries(1):
+            retry = self.client.post(url, {'second_party_signature': retry_file}, HTTP_IDEMPOTENCY_KEY='sign-1')
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'blobs'))), 1)
+        # A new key is a new request, and the agreement is signed already
+        retry_file.seek(0)
+        response = self.client.post(url, {'second_party_signature': retry_file}, HTTP_IDEMPOTENCY_KEY='sign-2')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+    def test_key_in_progress_or_expired(self):
+        agreement = make_agreement()
+        url = reverse('legalagreement-sign-agreement', args=[agreement.id])
+        record = IdempotencyKey.objects.create(key='sign-1', method='POST', path=url)
+
+        response = self.sign_with_key(url, 'sign-1')
+        self.assertEqual(response.status_code, 409)
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(days=2))
+        response = self.sign_with_key(url, 'sign-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 200)
+        self.assertEqual(purge_expired_keys(max_age=0), 1)
+
+    def sign_with_key(self, url, key):
+        signature = SimpleUploadedFile('signature.png', b'signature-bytes', content_type='image/png')
+        return self.client.post(url, {'second_party_signature': signature}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_losing_claim_deletes_its_file(self):
+        agreement = make_agreement()
+        self.sign(agreement)
+        name = blob_storage.save('late.png', io.BytesIO(b'late-signature'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(LegalAgreement.claim_signature(agreement.id, name))
+
+        self.assertFalse(blob_storage.exists(name))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+
+class ConcurrentSignTests(TransactionTestCase):
+    signers = 8
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_agreement_is_signed_exactly_once_under_contention(self):
+        agreement = make_agreement()
+        url = reverse('legalagreement-sign-agreement', args=[agreement.id])
+        barrier = threading.Barrier(self.signers)
+        statuses = []
+
+        def sign(number):
+            signature = SimpleUploadedFile('signature.png', f'signature-{number}'.encode(), content_type='image/png')
+            try:
+                barrier.wait()
+                response = APIClient().post(url, {'second_party_signature': signature})
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sign, args=(number,)) for number in range(self.signers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [200] + [400] * (self.signers - 1))
+        agreement.refresh_from_db()
+        self.assertEqual(agreement.signing_status, LegalAgreement.SigningStatus.SIGNED)
+        blob = Blob.objects.get()
+        self.assertEqual((blob.name, blob.ref_count), (agreement.second_party_signature.name, 1))
+        # Losers' files are gone; only the winning signature is stored
+        self.assertEqual(
+            [name for _, _, files in os.walk(os.path.join(self.media_root, 'blobs')) for name in files],
+            [os.path.basename(blob.name)],
+        )
+
+
+
+class MigrationTestCase(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def setUp(self):
+        super().setUp()
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('agreement')[0]
+        self.addCleanup(self.migrate, latest)
+
+
+class CreatedAtBackfillTests(MigrationTestCase):
+    before, after = ('agreement', '0013_idempotency_keys'), ('agreement', '0014_agreement_created_at_not_null')
+
+    def test_agreements_without_created_at_are_backfilled_and_paged(self):
+        apps = self.migrate(self.before)
+        LegalAgreement = apps.get_model('agreement', 'LegalAgreement')
+        for number in range(3):
+            LegalAgreement.objects.create(
+                content='', first_party_address='0xaaa', second_party_address=f'0x{number}',
+                first_party_address_normalized='0xaaa',
+            )
+        LegalAgreement.objects.filter(second_party_address__in=['0x0', '0x2']).update(created_at=None)
+
+        self.migrate(self.after)
+
+        clear_token_filter()
+        ids, url = [], reverse('legalagreement-by-party')
+        params = {'address': '0xaaa', 'limit': 1}
+        while url:
+            page = APIClient().get(url, params).json()
+            ids += [row['id'] for row in page['results']]
+            url, params = page['next'], None
+        self.assertEqual(sorted(ids), sorted(LegalAgreement.objects.values_list('id', flat=True)))
+        self.assertEqual(len(ids), 3)
+
+
+class ContentlessSearchIndexTests(MigrationTestCase):
+    before, after = ('agreement', '0014_agreement_created_at_not_null'), ('agreement', '0015_contentless_search_index')
+
+    def search(self, text):
+        return list(search_agreements(LegalAgreement.objects.all(), text).values_list('id', flat=True))
+
+    def test_existing_agreements_stay_searchable(self):
+        apps = self.migrate(self.before)
+        AgreementTemplate = apps.get_model('agreement', 'AgreementTemplate')
+        template = AgreementTemplate.objects.create(agreementType='Lease', body='Lease of {{ parcel }}')
+        old = apps.get_model('agreement', 'LegalAgreement').objects
+        plain = old.create(content='Loan of equipment', first_party_address='0xaaa', second_party_address='0xbbb')
+        templated = old.create(
+            content='', template=template, variables={'parcel': 'farmland'},
+            first_party_address='0xaaa', second_party_address='0xbbb', first_party_fullname='Ada',
+        )
+
+        self.migrate(self.after)
+
+        self.assertEqual(self.search('equipment'), [plain.id])
+        self.assertEqual(self.search('farmland ada'), [templated.id])
+
+    @skipUnless(
+        connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 43),
+        'contentless_delete needs SQLite 3.43',
+    )
+    def test_index_keeps_no_copy_of_the_text(self):
+        agreement = make_agreement(content='Loan of equipment')
+        agreement.first_party_fullname = 'Ada Lovelace'
+        agreement.save(update_fields=['first_party_fullname'])
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content, first_party_fullname FROM agreement_legalagreement_fts')
+            self.assertEqual(cursor.fetchall(), [(None, None)])
+        self.assertEqual(self.search('equipment lovelace'), [agreement.id])
+        agreement.delete()
+        self.assertEqual(self.search('equipment'), [])
+
+
+class ResumableUploadTests(MediaTestCase):
+    CONTENT = b'scanned-id-' * 1000
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(UPLOAD_SESSION_ROOT=os.path.join(self.media_root, 'partial'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def start(self, content=CONTENT):
+        response = self.client.post(reverse('upload-list'), {
+            'filename': 'id.png', 'size': len(content), 'sha256': hashlib.sha256(content).hexdigest(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response['Location']
+
+    def send(self, url, offset, chunk):
+        return self.client.patch(
+            url, chunk, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_upload_resumes_from_reported_offset(self):
+        url = self.start()
+        self.assertEqual(self.send(url, 0, self.CONTENT[:4000]).status_code, 204)
+
+        # A retried chunk for an old offset is refused; HEAD says where to resume
+        self.assertEqual(self.send(url, 0, self.CONTENT[:4000]).status_code, 409)
+        self.assertEqual(self.client.head(url)['Upload-Offset'], '4000')
+
+        response = self.send(url, 4000, self.CONTENT[4000:])
+        self.assertEqual(response['Upload-Offset'], str(len(self.CONTENT)))
+
+        session = UploadSession.objects.get()
+        response = self.client.post(f'{url}finalize/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        blob = Blob.objects.get(sha256=response.json()['sha256'])
+        self.assertFalse(os.path.exists(part_path(session)))
+        with blob_storage.open(blob.name) as stored:
+            self.assertEqual(stored.read(), self.CONTENT)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_checksum_mismatch_discards_upload(self):
+        url = self.start()
+        self.send(url, 0, b'x' * len(self.CONTENT))
+
+        response = self.client.post(f'{url}finalize/', {}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+
+    def test_sign_attaches_finished_upload(self):
+        agreement = make_agreement()
+        url = self.start()
+        self.send(url, 0, self.CONTENT)
+        upload_id = UploadSession.objects.get().id
+
+        response = self.client.post(
+            reverse('legalagreement-sign-agreement', args=[agreement.id]),
+            {'second_party_signature_upload': str(upload_id)},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        agreement.refresh_from_db()
+        blob = Blob.objects.get()
+        self.assertEqual(agreement.second_party_signature.name, blob.name)
+        self.assertEqual(blob.ref_count, 1)
+
+    def test_sign_rejects_malformed_or_unknown_upload_ids(self):
+        url = reverse('legalagreement-sign-agreement', args=[make_agreement().id])
+        for upload_id, expected in (('not-an-id', 400), (str(uuid.uuid4()), 404)):
+            response = self.client.post(url, {'second_party_signature_upload': upload_id})
+            self.assertEqual(response.status_code, expected)
+
+    def test_stale_sessions_are_purged(self):
+        self.start()
+        session = UploadSession.objects.get()
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(purge_stale_sessions(), 1)
+        self.assertFalse(os.path.exists(part_path(session)))
+
+    def test_unreferenced_blobs_are_purged_once_old(self):
+        url = self.start()
+        self.send(url, 0, self.CONTENT)
+        orphan = Blob.objects.get(sha256=self.client.post(f'{url}finalize/', {}, format='json').json()['sha256'])
+        agreement = make_agreement()
+        url = self.start(b'signature')
+        self.send(url, 0, b'signature')
+        response = self.client.post(
+            reverse('legalagreement-sign-agreement', args=[agreement.id]),
+            {'second_party_signature_upload': str(UploadSession.objects.get().id)},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(purge_orphan_blobs(), 0)
+        Blob.objects.update(created_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(purge_orphan_blobs(), 1)
+        self.assertFalse(Blob.objects.filter(pk=orphan.pk).exists())
+        self.assertFalse(blob_storage.exists(orphan.name))
+        agreement.refresh_from_db()
+        self.assertTrue(blob_storage.exists(agreement.second_party_signature.name))
+
+
+class AgreementFileTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.agreement = make_agreement()
+        self.client.post(
+            reverse('legalagreement-sign-agreement', args=[self.agreement.id]),
+            {'second_party_signature': SimpleUploadedFile('sig.png', b'0123456789', content_type='image/png')},
+        )
+        self.url = reverse('legalagreement-file', args=[self.agreement.id, 'second_party_signature'])
+        self.token = str(self.agreement.access_token)
+
+    def get(self, **headers):
+        return self.client.get(self.url, {'access_token': self.token}, headers=headers)
+
+    def test_requires_the_agreement_access_token(self):
+        self.assertEqual(self.client.get(self.url, {'access_token': 'wrong'}).status_code, 403)
+        missing = reverse('legalagreement-file', args=[self.agreement.id, 'first_party_signature'])
+        self.assertEqual(self.client.get(missing, {'access_token': self.token}).status_code, 404)
+
+    def test_full_and_conditional_responses(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        self.assertEqual(self.get(if_none_match=response['ETag']).status_code, 304)
+
+    def test_byte_ranges(self):
+        partial = self.get(range='bytes=2-5')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), b'2345')
+        self.assertEqual(partial['Content-Range'], 'bytes 2-5/10')
+
+        suffix = self.get(range='bytes=-3')
+        self.assertEqual(b''.join(suffix.streaming_content), b'789')
+
+        self.assertEqual(self.get(range='bytes=20-').status_code, 416)
+        self.assertEqual(self.get(range='bytes=2-5', if_range='"stale"').status_code, 200)
+
+    def by_token(self):
+        return self.client.get(reverse('legalagreement-get-by-access-token'), {'access_token': self.token}).json()
+
+    def test_representations_link_files_with_signed_urls(self):
+        url = self.by_token()['second_party_signature']
+        self.assertTrue(url.startswith(f'http://testserver{self.url}?expires='))
+
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(self.client.get(url.replace('signature=', 'signature=0')).status_code, 403)
+        # The same signature doesn't open another field
+        other = url.replace('second_party_signature', 'first_party_signature')
+        self.assertEqual(self.client.get(other).status_code, 403)
+        self.assertEqual(self.client.get(url.split('?')[0]).status_code, 403)
+
+    def test_public_representations_carry_no_file_links(self):
+        self.by_token()
+        detail = self.client.get(reverse('legalagreement-detail', args=[self.agreement.id])).json()
+        self.assertNotIn('second_party_signature', detail)
+        party = self.client.get(reverse('legalagreement-by-party'), {'address': self.agreement.second_party_address}).json()
+        self.assertNotIn('second_party_signature', party[0])
+
+    def test_urls_stop_working_once_the_file_is_replaced(self):
+        url = self.by_token()['second_party_signature']
+        LegalAgreement.objects.filter(id=self.agreement.id).update(second_party_signature='signatures/other.png')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_expired_urls_are_refused(self):
+        with mock.patch('agreement.media.time.time', return_value=time.time() - 3 * settings.FILE_URL_MAX_AGE):
+            url = self.by_token()['second_party_signature']
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_SENDFILE_PREFIX='/protected/')
+    def test_transfer_is_offloaded_to_the_web_server(self):
+        self.agreement.refresh_from_db()
+
+        response = self.get()
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.agreement.second_party_signature.name)
+        self.assertEqual(response.content, b'')
+
+
+class ExportTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('legalagreement-export')
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(admin)
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return gzip.decompress(b''.join(response.streaming_content))
+
+    def test_ndjson_export_resumes_after_watermark(self):
+        agreements = [make_agreement(content=f'Agreement {i}', variables={'n': i}) for i in range(5)]
+
+        rows = [json.loads(line) for line in self.download().decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [agreement.id for agreement in agreements])
+        self.assertEqual(rows[0]['content'], 'Agreement 0')
+        self.assertEqual(rows[0]['access_token'], str(agreements[0].access_token))
+
+        rows = [json.loads(line) for line in self.download(after=agreements[2].id).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [agreements[3].id, agreements[4].id])
+
+    def test_csv_export_and_chunked_progress(self):
+        agreements = [make_agreement(content=f'Agreement, {i}') for i in range(5)]
+
+        rows = list(csv.DictReader(io.StringIO(self.download(output='csv').decode())))
+        self.assertEqual([row['content'] for row in rows], [f'Agreement, {i}' for i in range(5)])
+
+        export = AgreementExport('csv', chunk_size=2)
+        data = gzip.decompress(b''.join(export.stream()))
+        self.assertEqual(data.decode().count('first_party_address'), 1)
+        self.assertEqual((export.count, export.last_id), (5, agreements[-1].id))
+
+    def test_media_is_bundled_into_tar(self):
+        agreement = make_agreement(
+            first_party_signature=SimpleUploadedFile('sig.png', b'signature-bytes'),
+        )
+        agreement.refresh_from_db()
+
+        with tarfile.open(fileobj=io.BytesIO(self.download(media=1))) as archive:
+            names = archive.getnames()
+            self.assertEqual(names[0], f'agreements-{agreement.id:012d}-{agreement.id:012d}.ndjson')
+            self.assertEqual(archive.extractfile(f'media/{agreement.first_party_signature.name}').read(), b'signature-bytes')
+
+    def test_export_is_admin_only(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+@override_settings(IMAGE_MAX_DIMENSION=800)
+class ValidIdImageTests(MediaTestCase):
+    def make_photo(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        Image.new('RGB', (3000, 1500), 'white').save(buffer, format='JPEG', exif=exif)
+        return SimpleUploadedFile('scan.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_valid_id_is_downscaled_stripped_and_thumbnailed(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('legalagreement-list'), {
+                'content': 'Agreement content',
+                'first_party_address': '0xAAA',
+                'second_party_address': '0xBBB',
+                'first_party_valid_id': self.make_photo(),
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(callbacks)
+
+        agreement = LegalAgreement.objects.get()
+        self.assertTrue(agreement.first_party_valid_id.name.endswith('.webp'))
+        with agreement.first_party_valid_id.open('rb') as stored, Image.open(stored) as image:
+            self.assertEqual(image.size, (800, 400))
+            self.assertEqual(len(image.getexif()), 0)
+
+        generate_thumbnails(agreement.first_party_valid_id.name)
+        body = self.client.get(
+            reverse('legalagreement-get-by-access-token'), {'access_token': str(agreement.access_token)},
+        ).json()
+        thumbnails = body['first_party_valid_id_thumbnails']
+        self.assertEqual(set(thumbnails), {'small', 'medium'})
+        response = self.client.get(thumbnails['small'])
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(max(image.size), 160)
+
+    def test_missing_thumbnails_are_rendered_on_request(self):
+        # The on-commit job is dropped, as when a worker restarts before it runs
+        response = self.client.post(reverse('legalagreement-list'), {
+            'content': 'Agreement content',
+            'first_party_address': '0xAAA',
+            'second_party_address': '0xBBB',
+            'first_party_valid_id': self.make_photo(),
+        })
+        thumbnails = response.json()['agreement']['first_party_valid_id_thumbnails']
+
+        response = self.client.get(thumbnails['medium'])
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(max(image.size), 640)
+
+    def test_decompression_bombs_are_rejected(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            response = self.client.post(reverse('legalagreement-list'), {
+                'content': 'Agreement content',
+                'first_party_address': '0xAAA',
+                'second_party_address': '0xBBB',
+                'first_party_valid_id': self.make_photo(),
+            })
+            blob = self.client.post(
+                reverse('legalagreement-upload-blob'), {'file': self.make_photo(), 'purpose': 'valid_id'},
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('first_party_valid_id', response.json())
+        self.assertEqual(blob.status_code, 400)
+        self.assertEqual(blob.json(), ['The image has too many pixels to process.'])
+        self.assertFalse(LegalAgreement.objects.exists())
+
+
+class AgreementCacheTests(MediaTestCase):
+    def test_retrieve_is_served_from_cache_until_the_agreement_changes(self):
+        agreement = make_agreement()
+        url = reverse('legalagreement-detail', args=[agreement.id])
+
+        first = self.client.get(url)
+        self.assertNotIn('access_token', first.json())
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.json(), first.json())
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        signature = SimpleUploadedFile('sig.png', b'signature-bytes', content_type='image/png')
+        self.client.post(reverse('legalagreement-sign-agreement', args=[agreement.id]), {'second_party_signature': signature})
+
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertEqual(changed.json()['signing_status'], 'signed')
+
+    def test_payload_cached_by_a_read_racing_the_write_is_dropped_on_commit(self):
+        agreement = make_agreement(agreementType='old')
+        url = reverse('legalagreement-detail', args=[agreement.id])
+        base_url = 'http://testserver/'
+
+        with self.captureOnCommitCallbacks(execute=True):
+            agreement.agreementType = 'new'
+            agreement.save()
+            # A concurrent read still sees the committed row and caches it
+            version = agreement_cache.current_version(agreement.id)
+            agreement_cache.set_payload(agreement.id, version, base_url, {'agreementType': 'old'})
+
+        self.assertEqual(self.client.get(url).json()['agreementType'], 'new')
+
+    def test_access_token_lookup_is_cached_and_forgotten_on_delete(self):
+        agreement = make_agreement()
+        url = reverse('legalagreement-get-by-access-token')
+        params = {'access_token': str(agreement.access_token)}
+
+        self.assertEqual(self.client.get(url, params).json()['access_token'], str(agreement.access_token))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+
+        self.client.delete(reverse('legalagreement-detail', args=[agreement.id]))
+        self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+@override_settings(ACCESS_TOKEN_FILTER='on')
+class AccessTokenFilterTests(AgreementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.agreement = make_agreement()
+        self.url = reverse('legalagreement-get-by-access-token')
+        # The first lookup loads the filter
+        self.assertEqual(self.client.get(self.url, {'access_token': str(self.agreement.access_token)}).status_code, 200)
+
+    def test_unknown_tokens_are_rejected_without_a_query(self):
+        update_url = reverse('legalagreement-update-by-access-token')
+        with self.assertNumQueries(0):
+            for token in (str(uuid.uuid4()), 'not-a-token'):
+                self.assertEqual(self.client.get(self.url, {'access_token': token}).status_code, 400)
+                response = self.client.patch(f'{update_url}?access_token={token}', {'email': 'a@example.com'})
+                self.assertEqual(response.status_code, 400)
+
+    def test_tokens_created_by_another_process_are_found_once_committed(self):
+        # bulk_create skips the signal that adds the token in this process
+        other = LegalAgreement.objects.bulk_create([
+            LegalAgreement(content='c', first_party_address='0xAAA', second_party_address='0xBBB'),
+        ])[0]
+        params = {'access_token': str(other.access_token)}
+        self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+        bump_generation()
+        self.assertEqual(self.client.get(self.url, params).json()['id'], other.id)
+
+    def test_filter_is_rebuilt_once_stale(self):
+        other = LegalAgreement.objects.bulk_create([
+            LegalAgreement(content='c', first_party_address='0xAAA', second_party_address='0xBBB'),
+        ])[0]
+        with override_settings(ACCESS_TOKEN_FILTER_RELOAD=0):
+            response = self.client.get(self.url, {'access_token': str(other.access_token)})
+        self.assertEqual(response.json()['id'], other.id)
+
+    def test_rebuild_scans_the_table_without_holding_the_lock(self):
+        scans = []
+
+        def add_rows(bloom, settled):
+            if settled == 0:
+                scans.append(tokenfilter._lock.locked())
+            return original(bloom, settled)
+
+        original = tokenfilter.add_rows
+        with mock.patch('agreement.tokenfilter.add_rows', side_effect=add_rows), \
+                override_settings(ACCESS_TOKEN_FILTER_RELOAD=0):
+            self.assertTrue(tokenfilter.might_exist(self.agreement.access_token))
+        self.assertEqual(scans, [False])
+
+    @override_settings(ACCESS_TOKEN_FILTER='auto')
+    def test_process_local_cache_falls_back_to_the_database(self):
+        other = LegalAgreement.objects.bulk_create([
+            LegalAgreement(content='c', first_party_address='0xAAA', second_party_address='0xBBB'),
+        ])[0]
+        self.assertEqual(self.client.get(self.url, {'access_token': str(other.access_token)}).json()['id'], other.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, {'access_token': 'not-a-token'}).status_code, 400)
+
+    def test_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        tokens = [uuid.uuid4().bytes for _ in range(1000)]
+        for token in tokens:
+            bloom.add(token)
+        self.assertTrue(all(token in bloom for token in tokens))
+        false_positives = sum(uuid.uuid4().bytes in bloom for _ in range(10_000))
+        self.assertLess(false_positives, 300)
+
+
+@override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {
+    'access_token': '3/min', 'party_client': '4/min', 'party_address': '2/min',
+}})
+class ThrottleTests(AgreementTestCase):
+    def test_access_token_lookups_are_limited_per_client_ip(self):
+        url = reverse('legalagreement-get-by-access-token')
+        params = {'access_token': str(uuid.uuid4())}
+        for _ in range(3):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+        throttled = self.client.get(url, params)
+        self.assertEqual(throttled.status_code, 429)
+        self.assertGreater(int(throttled['Retry-After']), 0)
+        self.assertEqual(self.client.get(url, params, REMOTE_ADDR='10.0.0.2').status_code, 400)
+
+    def test_party_listings_are_limited_per_client_and_address(self):
+        url = reverse('legalagreement-by-party')
+        for _ in range(2):
+            self.assertEqual(self.client.get(url, {'address': '0xAAA'}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'address': '0xaaa'}).status_code, 429)
+
+        # Another client's lookups don't use up the party's own allowance
+        self.assertEqual(self.client.get(url, {'address': '0xaaa'}, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def test_party_listings_are_limited_per_client_across_addresses(self):
+        url = reverse('legalagreement-by-party')
+        for number in range(4):
+            self.assertEqual(self.client.get(url, {'address': f'0x{number}'}).status_code, 200)
+
+        self.assertEqual(self.client.get(url, {'address': '0x4'}).status_code, 429)
+        self.assertEqual(self.client.get(url, {'address': '0x4'}, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    async def test_async_reads_apply_the_same_throttles(self):
+        view = async_views.async_reads(
+            async_views.get_by_access_token, None, LegalAgreementViewSet.action_throttles['get_by_access_token'],
+        )
+        request = AsyncRequestFactory().get('/', {'access_token': 'not-a-token'})
+        statuses = [(await view(request)).status_code for _ in range(4)]
+        self.assertEqual(statuses, [400, 400, 400, 429])
+
+
+class BulkCreateTests(MediaTestCase):
+    def upload_blob(self, content=b'signature-bytes', **data):
+        upload = SimpleUploadedFile('sig.png', content, content_type='image/png')
+        response = self.client.post(reverse('legalagreement-upload-blob'), {'file': upload, **data})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['token']
+
+    def item(self, **kwargs):
+        fields = {
+            'content': 'Agreement content',
+            'first_party_address': '0xAAA',
+            'second_party_address': '0xBBB',
+        }
+        fields.update(kwargs)
+        return fields
+
+    def test_bulk_create_inserts_agreements_and_queues_emails(self):
+        token = self.upload_blob()
+        payload = [
+            self.item(email=f'party{i}@example.com', first_party_signature=token)
+            for i in range(20)
+        ]
+
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('legalagreement-bulk-create'), payload, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(len(body), 20)
+        self.assertEqual(LegalAgreement.objects.count(), 20)
+        self.assertEqual(EmailOutbox.objects.count(), 20)
+        self.assertEqual(Blob.objects.get().ref_count, 20)
+        agreement = LegalAgreement.objects.get(access_token=body[0]['access_token'])
+        self.assertEqual(agreement.first_party_address_normalized, '0xaaa')
+        url = body[0]['agreement']['first_party_signature']
+        self.assertIn(f"/agreement/agreement/{body[0]['agreement']['id']}/files/first_party_signature/?", url)
+        self.assertEqual(b''.join(self.client.get(url).streaming_content), b'signature-bytes')
+
+    def test_bulk_create_reports_errors_per_item_and_inserts_nothing(self):
+        payload = [
+            self.item(),
+            self.item(first_party_address=''),
+            self.item(second_party_signature='not-a-token'),
+        ]
+
+        response = self.client.post(reverse('legalagreement-bulk-create'), payload, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(set(errors), {'1'})
+        self.assertIn('first_party_address', errors['1'])
+        self.assertFalse(LegalAgreement.objects.exists())
+
+        response = self.client.post(reverse('legalagreement-bulk-create'), [payload[0], payload[2]], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'1': {'second_party_signature': ['Invalid or expired blob token.']}})
+        self.assertFalse(LegalAgreement.objects.exists())
+
+    def test_blobs_are_attached_only_by_their_uploader_token(self):
+        self.upload_blob(b'victim-signature')
+        blob = Blob.objects.get()
+
+        response = self.client.post(
+            reverse('legalagreement-bulk-create'), [self.item(first_party_signature=str(blob.pk))], format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(LegalAgreement.objects.exists())
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+
+    def test_id_fields_take_only_images_processed_as_valid_ids(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, format='PNG')
+        raw = self.upload_blob(buffer.getvalue())
+        processed = self.upload_blob(buffer.getvalue(), purpose='valid_id')
+        url = reverse('legalagreement-bulk-create')
+
+        response = self.client.post(url, [self.item(first_party_valid_id=raw)], format='json')
+        self.assertEqual(response.json()['errors'], {'0': {'first_party_valid_id': ['Upload ID images with purpose=valid_id.']}})
+        response = self.client.post(url, [self.item(first_party_valid_id=processed)], format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class ApiDocsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'openapi.json')
+        settings_override = override_settings(API_SCHEMA_CACHE_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        clear_schema_cache()
+        self.addCleanup(clear_schema_cache)
+
+    def test_schema_is_generated_once_and_served_from_disk(self):
+        response = self.client.get(reverse('schema-swagger-ui'), {'format': 'openapi'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/uploads/', json.loads(response.content)['paths'])
+        self.assertTrue(os.path.exists(self.path))
+
+        with open(self.path, 'w') as file:
+            file.write('{"swagger": "2.0"}')
+        clear_schema_cache()
+        response = self.client.get(reverse('schema-redoc'), {'format': 'openapi'})
+        self.assertEqual(json.loads(response.content), {'swagger': '2.0'})
+
+    def test_ui_page_is_rendered(self):
+        response = self.client.get(reverse('schema-swagger-ui'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'swagger', response.content.lower())
+
+
+class InstrumentationTests(AgreementTestCase):
+    def test_request_breakdown_is_reported_logged_and_aggregated(self):
+        registry.reset()
+        make_agreement()
+
+        with self.assertLogs('agreement.performance', level='INFO') as logs:
+            response = self.client.get(reverse('legalagreement-by-party'), {'address': '0xaaa'})
+
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="1 calls".*serialize;dur=.*total;dur=')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'legalagreement-by-party')
+        self.assertEqual(line['phases']['db']['count'], 1)
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(admin)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('custos_request_duration_seconds_count{view="legalagreement-by-party"} 1', body)
+        self.assertIn('custos_phase_duration_seconds_bucket{phase="db",view="legalagreement-by-party",le="+Inf"} 1', body)
+
+    async def test_async_view_queries_are_timed(self):
+        registry.reset()
+        await LegalAgreement.objects.acreate(content='c', first_party_address='0xAAA', second_party_address='0xBBB')
+        view = PerformanceMiddleware(async_views.async_reads(async_views.by_party, None))
+
+        with self.assertLogs('agreement.performance', level='INFO'):
+            response = await view(AsyncRequestFactory().get('/', {'address': '0xaaa'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ calls"')
+        body = registry.render()
+        self.assertIn('custos_phase_duration_seconds_count{phase="db",view="unresolved"} 1', body)
+
+
+class AsyncReadViewTests(AgreementTestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+
+    async def test_async_by_party_matches_sync_view(self):
+        await LegalAgreement.objects.acreate(content='c', first_party_address='0xAAA', second_party_address='0xBBB')
+        await LegalAgreement.objects.acreate(content='c', first_party_address='0xCCC', second_party_address='0xaaa')
+
+        response = await async_views.by_party(self.factory.get('/', {'address': '0xaaa', 'exclude': 'content'}))
+        sync_response = await self.async_client.get(reverse('legalagreement-by-party'), {'address': '0xaaa', 'exclude': 'content'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), sync_response.json())
+
+    async def test_async_retrieve_and_access_token_lookup(self):
+        agreement = await LegalAgreement.objects.acreate(content='c', first_party_address='0xAAA', second_party_address='0xBBB')
+
+        response = await async_views.retrieve(self.factory.get('/'), pk=agreement.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('access_token', json.loads(response.content))
+
+        not_modified = await async_views.retrieve(self.factory.get('/', headers={'If-None-Match': response['ETag']}), pk=agreement.id)
+        self.assertEqual(not_modified.status_code, 304)
+
+        missing = await async_views.retrieve(self.factory.get('/'), pk=agreement.id + 1)
+        self.assertEqual(missing.status_code, 403)
+
+        by_token = await async_views.get_by_access_token(self.factory.get('/', {'access_token': str(agreement.access_token)}))
+        self.assertEqual(json.loads(by_token.content)['access_token'], str(agreement.access_token))
+
+
+class ReplicaRouterTests(TestCase):
+    @override_settings(REPLICA_DATABASE='replica')
+    @mock.patch.dict(settings.DATABASES, {'replica': {}})
+    def test_reads_use_replica_only_when_requested_outside_transactions(self):
+        router = ReplicaRouter()
+        default = mock.Mock(in_atomic_block=False)
+        with mock.patch('agreement.routers.connections', {'default': default}):
+            self.assertIsNone(router.db_for_read(LegalAgreement))
+            with replica_reads():
+                self.assertEqual(router.db_for_read(LegalAgreement), 'replica')
+                self.assertEqual(router.db_for_write(LegalAgreement), 'default')
+                default.in_atomic_block = True
+                self.assertIsNone(router.db_for_read(LegalAgreement))
+        self.assertFalse(router.allow_migrate('replica', 'agreement'))
+
+    def boot(self, **environ):
+        code = 'import django; django.setup(); from django.conf import settings; print(settings.DB_POOL_MODE)'
+        return subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, env={**os.environ, **environ},
+        )
+
+    def test_unknown_pool_mode_is_refused_at_startup(self):
+        result = self.boot(DB_POOL_MODE='pgbouncer')
+
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("DB_POOL_MODE must be persistent, pool or none, not 'pgbouncer'", result.stderr)
+
+    def test_async_views_do_not_keep_persistent_connections(self):
+        self.assertEqual(self.boot(ASYNC_READ_VIEWS='True').stdout.strip(), 'none')
+
+        result = self.boot(ASYNC_READ_VIEWS='True', DB_POOL_MODE='persistent')
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("DB_POOL_MODE=persistent can't be used with ASYNC_READ_VIEWS", result.stderr)
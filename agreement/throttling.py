@@ -0,0 +1,97 @@
+"""
+Rate limits for the access-token and party endpoints, which take guessable
+input. Each client gets a token bucket in the cache named by
+THROTTLE_CACHE_ALIAS (Redis or Memcached in production, so every worker
+shares the bucket): it holds up to the scope's request count, refills at
+count / period, and each request takes one token. Rates are DRF's
+DEFAULT_THROTTLE_RATES entries, e.g. '60/min'.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from .models import normalize_address
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    timer = time.time
+
+    @property
+    def cache(self):
+        return caches[settings.THROTTLE_CACHE_ALIAS]
+
+    def get_rate(self):
+        # Read per instance, so rate changes in settings take effect
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        # Not atomic: concurrent requests may each take the same token, which
+        # lets a burst overshoot by at most the number of workers
+        self.now = self.timer()
+        tokens, stamp = self.cache.get(self.key, (self.num_requests, self.now))
+        self.tokens = min(self.num_requests, tokens + (self.now - stamp) * self.num_requests / self.duration)
+        if self.tokens < 1:
+            return self.throttle_failure()
+        self.cache.set(self.key, (self.tokens - 1, self.now), self.duration)
+        return True
+
+    def wait(self):
+        return (1 - self.tokens) * self.duration / self.num_requests
+
+
+class AccessTokenRateThrottle(TokenBucketThrottle):
+    """
+    Per client IP, for endpoints looked up by access token.
+    """
+    scope = 'access_token'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class PartyClientRateThrottle(TokenBucketThrottle):
+    """
+    Per client IP across every party address it asks about, which bounds
+    enumeration of addresses.
+    """
+    scope = 'party_client'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class PartyAddressRateThrottle(TokenBucketThrottle):
+    """
+    Per party address and client IP, so repeated lookups of one address are
+    slowed without letting other clients use up the party's own allowance.
+    """
+    scope = 'party_address'
+
+    def get_cache_key(self, request, view):
+        address = normalize_address(request.GET.get('address'))
+        if not address:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': f'{self.get_ident(request)}:{address}'}
+
+
+def check_throttles(request, throttle_classes):
+    """
+    Apply `throttle_classes` to a request served outside DRF's dispatch (the
+    async read views). Raises Throttled.
+    """
+    waits = [
+        throttle.wait() for throttle in (throttle_class() for throttle_class in throttle_classes)
+        if not throttle.allow_request(request, None)
+    ]
+    if waits:
+        raise Throttled(wait=max(waits))
@@ -0,0 +1,227 @@
+"""
+Negative cache for access-token lookups: a Bloom filter of every issued
+token, held per process. A token the filter has never seen is rejected
+without a query; a hit, including the filter's rare false positives, goes
+on to the usual lookup.
+
+The filter is loaded from the table on first use, and agreements created
+by this process are added as they are saved. Creations commit a bump of a
+generation counter in the shared cache; a process that sees the counter
+change loads the newer rows before answering "no". Rows are re-read for
+ACCESS_TOKEN_FILTER_SETTLE seconds after creation, so an agreement whose
+transaction commits after a later id's is still picked up. The whole
+filter is rebuilt every ACCESS_TOKEN_FILTER_RELOAD seconds in case a bump
+was lost; the rebuild scans the table without holding the lock, so
+lookups don't queue behind it.
+
+A "no" is only as good as the generation counter, so with a process-local
+cache (the LocMem default) the filter is off unless ACCESS_TOKEN_FILTER
+is 'on', which is safe only when a single process serves requests.
+Malformed tokens are rejected either way.
+"""
+import hashlib
+import math
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import get_cache
+from .routers import primary_reads
+
+GENERATION_KEY = 'agreement:token-filter:generation'
+
+_lock = threading.Lock()
+_state = {'filter': None, 'settled': 0, 'generation': None, 'built_at': 0, 'rebuilding': False}
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+MODES = ('auto', 'on', 'off')
+
+
+class BloomFilter:
+    """
+    Bit array sized for `capacity` values at `error_rate` false positives,
+    probed by double hashing of a 128-bit BLAKE2b digest.
+    """
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        digest = hashlib.blake2b(value, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        added = False
+        for position in self.positions(value):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        self.count += added
+        return added
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+
+def parse_token(access_token):
+    try:
+        return uuid.UUID(str(access_token))
+    except ValueError:
+        return None
+
+
+def filter_enabled():
+    mode = settings.ACCESS_TOKEN_FILTER
+    if mode not in MODES:
+        raise ImproperlyConfigured(f"ACCESS_TOKEN_FILTER must be one of: {', '.join(MODES)}.")
+    if mode == 'auto':
+        return not isinstance(get_cache(), PROCESS_LOCAL_CACHES)
+    return mode == 'on'
+
+
+def stale():
+    return time.monotonic() - _state['built_at'] >= settings.ACCESS_TOKEN_FILTER_RELOAD
+
+
+def needs_rebuild():
+    bloom = _state['filter']
+    return bloom is None or bloom.count >= bloom.capacity or stale()
+
+
+def add_rows(bloom, settled):
+    """
+    Add the tokens of rows after id `settled` to `bloom`. Returns the new
+    settled id.
+    """
+    from .models import LegalAgreement
+
+    cutoff = timezone.now() - timedelta(seconds=settings.ACCESS_TOKEN_FILTER_SETTLE)
+    rows = (
+        LegalAgreement.objects.filter(id__gt=settled).order_by('id')
+        .values_list('id', 'access_token', 'created_at')
+    )
+    for pk, access_token, created_at in rows.iterator(chunk_size=5000):
+        bloom.add(access_token.bytes)
+        if created_at < cutoff:
+            settled = pk
+    return settled
+
+
+def rebuild():
+    """
+    Build a new filter from the whole table and swap it in. The scan runs
+    without the lock, so lookups carry on against the old filter (trusting
+    only its hits) meanwhile; one thread per process rebuilds at a time.
+    """
+    from .models import LegalAgreement
+
+    with _lock:
+        if _state['rebuilding']:
+            return
+        _state['rebuilding'] = True
+    try:
+        # Read before the query, so a creation committing meanwhile bumps past it
+        generation = get_cache().get(GENERATION_KEY)
+        built_at = time.monotonic()
+        with primary_reads():
+            bloom = BloomFilter(
+                max(LegalAgreement.objects.count() * 2, settings.ACCESS_TOKEN_FILTER_CAPACITY),
+                settings.ACCESS_TOKEN_FILTER_ERROR_RATE,
+            )
+            settled = add_rows(bloom, 0)
+        with _lock:
+            _state.update(filter=bloom, settled=settled, generation=generation, built_at=built_at)
+    finally:
+        _state['rebuilding'] = False
+
+
+def load():
+    """
+    Add the rows created since the last load. The caller holds the lock.
+    """
+    generation = get_cache().get(GENERATION_KEY)
+    with primary_reads():
+        _state['settled'] = add_rows(_state['filter'], _state['settled'])
+    _state['generation'] = generation
+
+
+def might_exist(access_token):
+    """
+    False when no agreement holds `access_token`; True when one may.
+    """
+    token = parse_token(access_token)
+    if token is None:
+        return False
+    if not filter_enabled():
+        return True
+    if needs_rebuild():
+        rebuild()
+    with _lock:
+        bloom = _state['filter']
+        if bloom is None or token.bytes in bloom:
+            # No filter yet while another thread builds the first one
+            return True
+        if stale():
+            # Being rebuilt by another thread; a miss can't be trusted
+            return True
+        if get_cache().get(GENERATION_KEY) == _state['generation']:
+            return False
+        load()
+        return token.bytes in bloom
+
+
+async def amight_exist(access_token):
+    token = parse_token(access_token)
+    if token is None:
+        return False
+    if not filter_enabled():
+        return True
+    bloom = _state['filter']
+    if bloom is not None:
+        if token.bytes in bloom:
+            return True
+        if not stale() and await get_cache().aget(GENERATION_KEY) == _state['generation']:
+            return False
+    return await sync_to_async(might_exist)(access_token)
+
+
+def remember_tokens(access_tokens):
+    """
+    Add newly created tokens here, and have other processes load them once
+    the transaction commits.
+    """
+    with _lock:
+        if _state['filter'] is not None:
+            for access_token in access_tokens:
+                _state['filter'].add(access_token.bytes)
+    transaction.on_commit(bump_generation)
+
+
+def bump_generation():
+    cache = get_cache()
+    if cache.add(GENERATION_KEY, 1, None):
+        return
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Evicted since the add
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def clear_token_filter():
+    with _lock:
+        _state.update(filter=None, settled=0, generation=None, built_at=0, rebuilding=False)
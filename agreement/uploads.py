@@ -0,0 +1,215 @@
+"""
+Resumable uploads for large ID scans and signatures, modelled on the tus
+protocol: a client creates a session declaring the file's size, PATCHes
+the bytes in chunks at the session's current offset, and finalizes it.
+After a dropped connection it asks for the offset and resumes from there
+instead of starting over.
+
+Chunks are streamed from the request straight into a part file under
+UPLOAD_SESSION_ROOT. Finalizing checks the size and SHA-256 and renames
+the part file into the blob store, so the assembled file is never copied.
+"""
+import hashlib
+import os
+import re
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ParseError, ValidationError
+
+from .images import normalize_image
+from .models import Blob, UploadSession
+from .storage import blob_digest, blob_storage
+
+CHUNK_SIZE = 64 * 1024
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+BLOB_TOKEN_SALT = 'agreement.uploads.blob'
+
+
+class OffsetConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Upload-Offset does not match the upload's current offset."
+
+
+def part_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_ROOT, f'{session.pk}.part')
+
+
+def clean_sha256(value):
+    value = (value or '').strip().lower()
+    if value and not SHA256_RE.match(value):
+        raise ParseError("Expected a hex-encoded SHA-256 digest.")
+    return value
+
+
+def get_session(upload_id):
+    try:
+        pk = uuid.UUID(str(upload_id))
+    except ValueError:
+        raise ParseError("Expected an upload id.")
+    session = UploadSession.objects.filter(pk=pk).first()
+    if session is None:
+        raise NotFound("Upload not found.")
+    return session
+
+
+def create_session(filename, size, sha256=''):
+    if size <= 0 or size > settings.UPLOAD_MAX_SIZE:
+        raise ParseError(f"Size must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes.")
+    session = UploadSession.objects.create(
+        filename=os.path.basename(filename)[:255], size=size, sha256=clean_sha256(sha256),
+    )
+    os.makedirs(settings.UPLOAD_SESSION_ROOT, exist_ok=True)
+    open(part_path(session), 'wb').close()
+    return session
+
+
+def append_chunk(session, offset, stream, length):
+    """
+    Write up to `length` bytes from `stream` at `offset` and advance the
+    session past what was actually received, so a chunk cut short by the
+    network still counts. Returns the new offset.
+    """
+    if offset != session.offset:
+        raise OffsetConflict()
+    if length > session.size - offset:
+        raise ParseError("The chunk runs past the declared upload size.")
+
+    written = 0
+    try:
+        with open(part_path(session), 'r+b') as part:
+            part.seek(offset)
+            # Drop bytes left behind by an earlier chunk that wasn't counted
+            part.truncate()
+            while written < length:
+                chunk = stream.read(min(CHUNK_SIZE, length - written))
+                if not chunk:
+                    break
+                part.write(chunk)
+                written += len(chunk)
+    finally:
+        # Compare-and-set, so of two concurrent chunks for one offset only
+        # one is counted; the SHA-256 check on finalize catches the rest
+        advanced = UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+            offset=offset + written, updated_at=timezone.now(),
+        )
+    if not advanced:
+        raise OffsetConflict()
+    session.offset = offset + written
+    return session.offset
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for chunk in iter(lambda: part.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def finalize_session(session, sha256='', purpose=''):
+    """
+    Verify a complete upload and move it into the blob store. Pass
+    purpose='valid_id' to run the valid-ID image processing. Returns the
+    Blob, with `normalized` set when it was processed as an image; attach
+    it to an agreement by assigning `blob.name` to a file field.
+    """
+    expected = clean_sha256(sha256) or session.sha256
+    if not expected:
+        raise ParseError("A SHA-256 digest is required to finalize an upload.")
+    if session.offset != session.size:
+        raise ParseError(f"Upload is incomplete: {session.offset} of {session.size} bytes received.")
+
+    path = part_path(session)
+    digest = file_sha256(path)
+    if digest != expected:
+        # The bytes can't be trusted; the client has to upload them again
+        discard_session(session)
+        raise ParseError("Checksum mismatch; the upload has been discarded.")
+
+    processed = None
+    if purpose == 'valid_id':
+        try:
+            with open(path, 'rb') as part:
+                processed = normalize_image(part)
+        except ValidationError:
+            discard_session(session)
+            raise
+    if processed is not None:
+        os.remove(path)
+        name = blob_storage.save(processed.name, processed)
+    else:
+        name = blob_storage.adopt(path, session.filename, digest)
+
+    blob, _ = Blob.objects.get_or_create(
+        sha256=blob_digest(name),
+        defaults={'name': name, 'size': blob_storage.size(name)},
+    )
+    blob.normalized = processed is not None
+    session.delete()
+    return blob
+
+
+def blob_token(blob):
+    """
+    The handle an uploader attaches `blob` with in `bulk_create`. It is
+    signed, so it can't be guessed from the sequential blob ids, and
+    records whether the bytes went through the valid-ID image processing.
+    """
+    payload = {'blob': blob.pk, 'sha256': blob.sha256, 'normalized': getattr(blob, 'normalized', False)}
+    return signing.dumps(payload, salt=BLOB_TOKEN_SALT)
+
+
+def read_blob_token(token):
+    """
+    The payload of a token from `blob_token`, or None when it was not
+    issued here or is older than BLOB_ORPHAN_TTL (by which time an
+    unattached blob is purged).
+    """
+    try:
+        return signing.loads(str(token), salt=BLOB_TOKEN_SALT, max_age=settings.BLOB_ORPHAN_TTL)
+    except signing.BadSignature:
+        return None
+
+
+def discard_session(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def purge_stale_sessions(max_age=None):
+    """
+    Discard sessions that haven't received a chunk within `max_age`
+    seconds (UPLOAD_SESSION_TTL by default). Returns how many went.
+    """
+    max_age = settings.UPLOAD_SESSION_TTL if max_age is None else max_age
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    stale = list(UploadSession.objects.filter(updated_at__lt=cutoff))
+    for session in stale:
+        discard_session(session)
+    return len(stale)
+
+
+def purge_orphan_blobs(max_age=None):
+    """
+    Delete blobs still unreferenced `max_age` seconds after they were
+    stored (BLOB_ORPHAN_TTL by default): finalized uploads that were never
+    attached, or whose signing claim was lost. Returns how many went.
+    """
+    max_age = settings.BLOB_ORPHAN_TTL if max_age is None else max_age
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    purged = 0
+    for blob in Blob.objects.filter(ref_count=0, created_at__lt=cutoff).iterator():
+        # Only while still unreferenced; an agreement may have taken it since
+        deleted, _ = Blob.objects.filter(pk=blob.pk, ref_count=0).delete()
+        if deleted:
+            Blob.delete_orphan(blob.sha256, blob.name)
+            purged += 1
+    return purged
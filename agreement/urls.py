@@ -1,11 +1,36 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import LegalAgreementViewSet
+from . import async_views
+from .views import AgreementTemplateViewSet, LegalAgreementViewSet, MetricsView, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'agreement', LegalAgreementViewSet, basename='legalagreement')
+router.register(r'templates', AgreementTemplateViewSet, basename='agreementtemplate')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('agreement/by_party/', LegalAgreementViewSet.as_view({'get': 'by_party'}), name='legalagreement-by-party'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
+
+# Under ASGI the read endpoints are served by native async views; other
+# methods on the same routes still go to the viewset.
+async_urlpatterns = [
+    path('agreement/<int:pk>/', async_views.async_reads(
+        async_views.retrieve,
+        LegalAgreementViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}),
+    ), name='legalagreement-detail-async'),
+    path('agreement/by_party/', async_views.async_reads(
+        async_views.by_party, LegalAgreementViewSet.as_view({'get': 'by_party'}),
+        LegalAgreementViewSet.action_throttles['by_party'],
+    ), name='legalagreement-by-party-async'),
+    path('agreement/access_token/', async_views.async_reads(
+        async_views.get_by_access_token, LegalAgreementViewSet.as_view({'get': 'get_by_access_token'}),
+        LegalAgreementViewSet.action_throttles['get_by_access_token'],
+    ), name='legalagreement-get-by-access-token-async'),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
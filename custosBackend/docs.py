@@ -0,0 +1,90 @@
+"""
+Swagger UI and ReDoc, with drf_yasg imported on the first docs request
+instead of at worker boot; the docs are rarely used and drf_yasg (with its
+YAML and schema-generation stack) is among the slowest imports of the
+project.
+
+The schema itself is generated once per process, or once per deploy when
+API_SCHEMA_CACHE_PATH is set: it is then written to that file (or built
+ahead of time with `manage.py generate_schema`) and served from it.
+"""
+import functools
+import os
+
+from django.conf import settings
+from django.http import HttpResponse
+
+_schema = []
+
+
+def api_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Custos diretriz Backend doc",
+        default_version='v1',
+        contact=openapi.Contact(email="goodness@custosdiretriz.com"),
+        license=openapi.License(name="MIT License"),
+    )
+
+
+@functools.cache
+def schema_view():
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+
+    return get_schema_view(api_info(), public=True, permission_classes=(permissions.AllowAny,))
+
+
+@functools.cache
+def ui_view(renderer):
+    return schema_view().with_ui(renderer, cache_timeout=0)
+
+
+def generate_schema():
+    """
+    The OpenAPI document as JSON bytes. Built without a request, so it
+    holds no host and the UI uses the one it was loaded from.
+    """
+    from drf_yasg.codecs import OpenAPICodecJson
+
+    schema = schema_view().generator_class(api_info()).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[], pretty=False).encode(schema)
+
+
+def write_schema(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    partial = f'{path}.tmp'
+    with open(partial, 'wb') as file:
+        file.write(data)
+    os.replace(partial, path)
+
+
+def schema_bytes():
+    if not _schema:
+        path = settings.API_SCHEMA_CACHE_PATH
+        if path and os.path.exists(path):
+            with open(path, 'rb') as file:
+                data = file.read()
+        else:
+            data = generate_schema()
+            if path:
+                write_schema(path, data)
+        _schema.append(data)
+    return _schema[0]
+
+
+def clear_schema_cache():
+    _schema.clear()
+
+
+def docs_view(renderer):
+    """
+    The `renderer` ('swagger' or 'redoc') UI page; with ?format=openapi,
+    the schema it loads.
+    """
+    def view(request, *args, **kwargs):
+        if request.GET.get('format') == 'openapi':
+            return HttpResponse(schema_bytes(), content_type='application/openapi+json')
+        return ui_view(renderer)(request, *args, **kwargs)
+    return view
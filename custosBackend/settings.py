@@ -11,8 +11,10 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 
 ENVIROMENT= config('ENVIROMENT')
@@ -50,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'agreement.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,6 +83,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'custosBackend.wsgi.application'
 
+# Serve agreement reads with native async views (enabled by asgi.py)
+ASYNC_READ_VIEWS = config('ASYNC_READ_VIEWS', default=False, cast=bool)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -87,6 +93,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the in-memory default, whose shared cache fails
+        # concurrent writers at once instead of waiting; the concurrency
+        # tests need SQLite's ordinary busy timeout
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     },
     'production': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -98,8 +108,112 @@ DATABASES = {
     }
 }
 
+# Connection reuse for Postgres:
+#   persistent - keep connections open for DB_CONN_MAX_AGE seconds, checked before reuse
+#   pool       - Django's native psycopg 3 pool (requires `psycopg[pool]`)
+#   none       - a new connection per request
+# Persistent connections are for sync workers only: async views query from
+# sync_to_async threads, whose connections aren't closed per request, so
+# under ASGI the default is none.
+DB_POOL_MODE = config('DB_POOL_MODE', default='none' if ASYNC_READ_VIEWS else 'persistent')
+
+if DB_POOL_MODE not in ('persistent', 'pool', 'none'):
+    raise ImproperlyConfigured(f"DB_POOL_MODE must be persistent, pool or none, not {DB_POOL_MODE!r}.")
+if DB_POOL_MODE == 'persistent' and ASYNC_READ_VIEWS:
+    raise ImproperlyConfigured("DB_POOL_MODE=persistent can't be used with ASYNC_READ_VIEWS; use none or pool.")
+if DB_POOL_MODE == 'pool' and not (find_spec('psycopg') and find_spec('psycopg_pool')):
+    # requirements.txt installs psycopg2, which Django can't pool
+    raise ImproperlyConfigured("DB_POOL_MODE=pool requires psycopg 3 with its pool: pip install 'psycopg[pool]'.")
+
+if DB_POOL_MODE == 'persistent':
+    DATABASES['production'].update({
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+    })
+elif DB_POOL_MODE == 'pool':
+    DATABASES['production']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        },
+    }
+
+# Read replica used by the agreement read endpoints (see agreement/routers.py)
+REPLICA_DATABASE = 'replica'
+DATABASE_ROUTERS = ['agreement.routers.ReplicaRouter']
+
 if ENVIROMENT == 'production':
     DATABASES['default'] = DATABASES['production']
+    if config('DB_REPLICA_HOST', default=''):
+        DATABASES[REPLICA_DATABASE] = {
+            **DATABASES['production'],
+            'HOST': config('DB_REPLICA_HOST'),
+            'PORT': config('DB_REPLICA_PORT', default=DATABASES['production']['PORT']),
+        }
+elif config('DB_LOCAL_REPLICA', default=False, cast=bool):
+    # A second connection to the local SQLite file stands in for a zero-lag replica
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at Redis in production,
+# e.g. django.core.cache.backends.redis.RedisCache and redis://host:6379/0
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+AGREEMENT_CACHE_ALIAS = 'default'
+AGREEMENT_CACHE_TIMEOUT = config('AGREEMENT_CACHE_TIMEOUT', default=3600, cast=int)
+AGREEMENT_CACHE_REPLICA_TIMEOUT = config('AGREEMENT_CACHE_REPLICA_TIMEOUT', default=30, cast=int)
+# Compiled agreement templates kept per process (see agreement/rendering.py)
+AGREEMENT_TEMPLATE_CACHE_SIZE = config('AGREEMENT_TEMPLATE_CACHE_SIZE', default=256, cast=int)
+
+# Token-bucket rate limits (see agreement/throttling.py), kept in a cache
+# every worker shares
+THROTTLE_CACHE_ALIAS = 'default'
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_RATES': {
+        'access_token': config('THROTTLE_ACCESS_TOKEN_RATE', default='60/min'),
+        'party_client': config('THROTTLE_PARTY_CLIENT_RATE', default='300/min'),
+        'party_address': config('THROTTLE_PARTY_ADDRESS_RATE', default='120/min'),
+    },
+}
+
+# Bloom filter of issued access tokens (see agreement/tokenfilter.py)
+# auto: on only with a cache shared between processes; 'on' is safe only
+# when a single process serves requests
+ACCESS_TOKEN_FILTER = config('ACCESS_TOKEN_FILTER', default='auto')
+ACCESS_TOKEN_FILTER_RELOAD = config('ACCESS_TOKEN_FILTER_RELOAD', default=300, cast=int)
+ACCESS_TOKEN_FILTER_CAPACITY = config('ACCESS_TOKEN_FILTER_CAPACITY', default=100_000, cast=int)
+ACCESS_TOKEN_FILTER_ERROR_RATE = config('ACCESS_TOKEN_FILTER_ERROR_RATE', default=0.001, cast=float)
+ACCESS_TOKEN_FILTER_SETTLE = config('ACCESS_TOKEN_FILTER_SETTLE', default=60, cast=int)
+
+
+# Logging
+# One JSON line per request from agreement.middleware.PerformanceMiddleware
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'agreement.performance': {
+            'handlers': ['console'],
+            'level': config('PERFORMANCE_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
 
 
 # Password validation
@@ -138,6 +252,49 @@ USE_TZ = True
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Agreement files are only served by the access-checked files/<field>/
+# endpoint; never expose MEDIA_ROOT from the web server. Representations
+# link files with signed URLs valid for one to two FILE_URL_MAX_AGE
+# periods, so keep it above AGREEMENT_CACHE_TIMEOUT.
+FILE_URL_MAX_AGE = config('FILE_URL_MAX_AGE', default=24 * 60 * 60, cast=int)
+
+# Hand agreement file transfers to the web server: '' (serve from Django),
+# 'x-accel-redirect' (nginx, via an internal location at MEDIA_SENDFILE_PREFIX
+# aliased to MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='')
+MEDIA_SENDFILE_PREFIX = config('MEDIA_SENDFILE_PREFIX', default='/protected-media/')
+
+# Resumable uploads (see agreement/uploads.py). Part files are renamed into
+# the blob store when finalized, so keep UPLOAD_SESSION_ROOT on the same
+# filesystem as MEDIA_ROOT to avoid a copy.
+UPLOAD_SESSION_ROOT = config('UPLOAD_SESSION_ROOT', default=os.path.join(BASE_DIR, 'uploads'))
+UPLOAD_MAX_SIZE = config('UPLOAD_MAX_SIZE', default=50 * 1024 * 1024, cast=int)
+UPLOAD_SESSION_TTL = config('UPLOAD_SESSION_TTL', default=24 * 60 * 60, cast=int)
+
+# Finalized uploads no agreement references are deleted this many seconds
+# after they were stored, by `manage.py purge_blobs`
+BLOB_ORPHAN_TTL = config('BLOB_ORPHAN_TTL', default=7 * 24 * 60 * 60, cast=int)
+
+# How long a stored Idempotency-Key response is replayed (see
+# agreement/idempotency.py); purge older keys with `manage.py purge_idempotency_keys`
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60, cast=int)
+
+# Where the generated API schema is kept between processes; build it at
+# deploy time with `manage.py generate_schema`. Empty: generate it in each
+# process on the first docs request.
+API_SCHEMA_CACHE_PATH = config('API_SCHEMA_CACHE_PATH', default='')
+
+# Rows fetched per round trip by agreement exports (see agreement/export.py)
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+BULK_CREATE_MAX_ITEMS = config('BULK_CREATE_MAX_ITEMS', default=500, cast=int)
+
+# Valid-ID image processing (see agreement/images.py)
+IMAGE_MAX_DIMENSION = config('IMAGE_MAX_DIMENSION', default=2048, cast=int)
+IMAGE_FORMAT = config('IMAGE_FORMAT', default='WEBP')
+IMAGE_QUALITY = config('IMAGE_QUALITY', default=80, cast=int)
+IMAGE_THUMBNAIL_SIZES = {'small': 160, 'medium': 640}
+IMAGE_WORKERS = config('IMAGE_WORKERS', default=2, cast=int)
 
 STATIC_URL = 'staticfiles/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -150,11 +307,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 """""email settings"""
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=os.path.join(BASE_DIR, 'sent_emails'))
 
 EMAIL_HOST = config('EMAIL_HOST')
 EMAIL_PORT = config('EMAIL_PORT', cast=int)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
-DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL')
\ No newline at end of file
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL')
+
+# Outbox delivery (see `manage.py send_outbox`)
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=100, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+OUTBOX_RETRY_BASE_SECONDS = config('OUTBOX_RETRY_BASE_SECONDS', default=30, cast=int)
+# How long a claimed email is held back from other workers while it is sent;
+# keep it above the time a batch takes
+OUTBOX_LEASE_SECONDS = config('OUTBOX_LEASE_SECONDS', default=10 * 60, cast=int)